@@ -1,4 +1,7 @@
 # bot.py
+from startup import StartupTimer
+startup = StartupTimer()
+import asyncio
 import discord
 from discord.ext import commands
 import os
@@ -8,6 +11,16 @@ import re
 import requests
 from report import Report
 from report_mod import Report_Mod
+from report_store import make_report_store
+from report_index import ReportIndex
+from report_pages import ReportFragments
+from user_cache import UserCache
+from dispatcher import UserDispatcher
+from outbound import send_all
+from metrics import metrics, STATS_KEYWORD
+from metadata_service import MetadataService, METADATA_PATH
+from scammer_model import ScammerScorer, SCAMMER_MODEL_PATH
+from hot_reload import ArtifactWatcher
 import pdb
 
 # Set up logging to the console
@@ -25,6 +38,7 @@ with open(token_path) as f:
     # If you get an error here, it means your token is formatted incorrectly. Did you put it in quotes?
     tokens = json.load(f)
     discord_token = tokens['discord']
+startup.mark("imports")
 
 class ModBot(discord.Client):
     def __init__(self): 
@@ -35,24 +49,54 @@ class ModBot(discord.Client):
         self.mod_channels = {} # Map from guild to the mod channel id for that guild
         self.reports = {} # Map from user IDs to the state of their report
         self.mod_reports = {} # Map from mod IDs to the state of their report
-        self.saved_report_history = {} # Map from user IDs to their saved report history
         self.counter = 0 # Counter for reports to have unique IDs
         self.mod_channel = None
-        # Check if reports data file exists
-        if os.path.isfile("saved_report_history.json"):
-            with open("saved_report_history.json", "r") as json_file:
-                json_data = json.load(json_file)
-                self.counter = json_data["counter"]
-                self.saved_report_history = json_data["user_reports"]
-        else:
-            initial_data = {
-                "counter": 0,
-                "user_reports": {}
-            }
-            with open("saved_report_history.json", "w") as json_file:
-                json.dump(initial_data, json_file)
-            self.counter = initial_data["counter"]
-            self.saved_report_history = initial_data["user_reports"]   
+        # Profile metadata indexed by username and user ID, and scammer probabilities from the exported profile model.
+        # Both are loaded in the background during login and reloaded when their files change (see setup_hook), so
+        # always read them through self. Until then nobody has metadata or a score.
+        self.user_metadata = MetadataService()
+        self.scammer_scorer = ScammerScorer(self.user_metadata)
+        # In-memory index of saved reports, written through to the report store (see report_store.py)
+        self.report_index = ReportIndex(make_report_store())
+        self.counter = self.report_index.load()
+        # Rendered entries for the moderator report queues, shared by every Report_Mod
+        self.report_fragments = ReportFragments(self.report_index)
+        # Users and DM channels for notifications, so repeat notifications skip the REST lookup
+        self.user_cache = UserCache(self)
+        # Runs each user's DMs and mod channel messages in order, and different users' in parallel
+        self.dispatcher = UserDispatcher()
+        startup.mark("init")
+
+
+    def load_user_scoring(self):
+        # Built together so a reload always swaps in a scorer that matches the metadata
+        user_metadata = MetadataService().load()
+        return user_metadata, ScammerScorer(user_metadata).load()
+
+
+    def swap_user_scoring(self, user_scoring):
+        self.user_metadata, self.scammer_scorer = user_scoring
+
+
+    async def load_user_scoring_in_background(self):
+        self.swap_user_scoring(await startup.run_in_background("user_scoring", self.load_user_scoring))
+
+
+    async def setup_hook(self):
+        startup.mark("login")
+        # Loaded on a thread while the gateway connects instead of delaying it
+        asyncio.ensure_future(self.load_user_scoring_in_background())
+        # Pick up a new metadata.csv or scammer model without restarting and dropping in-progress reports
+        self.user_scoring_watcher = ArtifactWatcher([METADATA_PATH, SCAMMER_MODEL_PATH], self.load_user_scoring, self.swap_user_scoring)
+        self.user_scoring_watcher.start()
+
+
+    async def close(self):
+        # Flush any pending report writes before disconnecting, and disconnect even if that fails
+        try:
+            await self.report_index.durable()
+        finally:
+            await super().close()
 
 
     async def on_ready(self):
@@ -74,6 +118,9 @@ class ModBot(discord.Client):
                 if channel.name == f'group-{self.group_num}-mod':
                     self.mod_channels[guild.id] = channel
                     self.mod_channel = channel
+        if not startup.reported:
+            startup.mark("gateway")
+            startup.ready()
         
 
     async def on_message(self, message):
@@ -89,11 +136,11 @@ class ModBot(discord.Client):
         if message.guild:
             # Forward mod messages to mod channel
             if message.channel.name == f'group-{self.group_num}-mod':
-                await self.handle_mod_channel_message_reply(message)
+                self.dispatcher.submit(message.author.id, self.handle_mod_channel_message_reply, message)
             else:
                 await self.handle_channel_message(message)
         else:
-            await self.handle_dm(message)
+            self.dispatcher.submit(message.author.id, self.handle_dm, message)
 
     async def handle_dm(self, message):
         # Handle a help message
@@ -116,8 +163,7 @@ class ModBot(discord.Client):
 
         # Let the report class handle this message; forward all the messages it returns to us
         responses = await self.reports[author_id].handle_message(message)
-        for r in responses:
-            await message.channel.send(r)
+        await send_all(message.channel, responses)
 
         # If the report is complete or cancelled, remove it from our map
         if author_id in self.reports and self.reports[author_id].report_complete():
@@ -131,22 +177,10 @@ class ModBot(discord.Client):
             # Formart report details
             report_details_formatted = "\n".join([f"{i}:   *{j}*" for i, j in report_details.items()])
             # Send report to mod channel
-            await self.mod_channel.send(f"🚨__**Reported Message:**__🚨\n{report_details_formatted}")
-
-            # Save report to JSON file
-            # Check if individual has a saved report history (they have been reported before)
-            reported_user = report_details["Reported user"]
-            if reported_user not in self.saved_report_history:
-                self.saved_report_history[reported_user] = []
-            # Append report to user's report history
-            self.saved_report_history[reported_user].append(report_details)
-            # Save data to JSON file
-            data_to_save = {
-                "counter": self.counter,
-                "user_reports": self.saved_report_history
-            }
-            with open("saved_report_history.json", "w") as json_file:
-                json.dump(data_to_save, json_file, indent=4)
+            await send_all(self.mod_channel, [f"🚨__**Reported Message:**__🚨\n{report_details_formatted}"])
+
+            # Append report to the reported user's saved report history
+            self.report_index.add_report(report_details, self.counter)
 
 
     async def handle_mod_channel_message_reply(self, message):
@@ -158,6 +192,10 @@ class ModBot(discord.Client):
             await message.reply(reply)
             return
 
+        if message.content == STATS_KEYWORD:
+            await message.reply(metrics.format())
+            return
+
         author_id = message.author.id
         responses = []
 
@@ -171,8 +209,7 @@ class ModBot(discord.Client):
 
         # Let the report class handle this message; forward all the messages it returns to us
         responses = await self.mod_reports[author_id].handle_message(message)
-        for r in responses:
-            await message.channel.send(r)
+        await send_all(message.channel, responses)
 
         # If the report is complete or cancelled, remove it from our map
         if author_id in self.mod_reports and self.mod_reports[author_id].report_complete():
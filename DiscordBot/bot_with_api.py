@@ -1,4 +1,7 @@
 # bot.py
+from startup import StartupTimer
+startup = StartupTimer()
+import asyncio
 import discord
 from discord.ext import commands
 import os
@@ -8,23 +11,30 @@ import re
 import requests
 from report import Report
 from report_mod import Report_Mod
+from report_store import make_report_store
+from report_index import ReportIndex
+from report_pages import ReportFragments
+from user_cache import UserCache
+from dispatcher import UserDispatcher
+from outbound import send_all
+from classifier import AsyncClassifier, BatchingClassifier, split_context_flag
+from classifier_backends import make_backend
+from rate_limit import RateLimitedBackend
+from circuit_breaker import CircuitBreaker
+from classification_cache import ClassificationCache
+from local_classifier import LocalClassifier
+from platform_matcher import PlatformMatcher, PLATFORM_CATEGORY
+from near_duplicates import NearDuplicateIndex
+from conversation_context import ConversationContext
+from classification_queue import ClassificationQueue
+from metrics import metrics, STATS_KEYWORD
+from metadata_service import MetadataService, METADATA_PATH
+from scammer_model import ScammerScorer, SCAMMER_MODEL_PATH
+from hot_reload import ArtifactWatcher
 import pdb
-import vertexai
-from vertexai.generative_models import GenerativeModel, ChatSession
-import pandas as pd
-
-# Import metadata
-metadata = pd.read_csv("DiscordBot/datasets/metadata.csv")
 P_THRESHOLD = 0.8
 R_THRESHOLD = 3
 
-# Set up Vertex API
-project_id = "cs152-bot-424101" # Gabbys project ID
-# project_id = "cs152-424619" # Giancarlos project ID 
-vertexai.init(project=project_id, location="us-central1")
-model = GenerativeModel(model_name="gemini-1.0-pro-002")
-chat = model.start_chat()
-
 # Set up logging to the console
 logger = logging.getLogger('discord')
 logger.setLevel(logging.DEBUG)
@@ -40,6 +50,7 @@ with open(token_path) as f:
     # If you get an error here, it means your token is formatted incorrectly. Did you put it in quotes?
     tokens = json.load(f)
     discord_token = tokens['discord']
+startup.mark("imports")
 
 class ModBot(discord.Client):
     def __init__(self): 
@@ -50,24 +61,76 @@ class ModBot(discord.Client):
         self.mod_channels = {} # Map from guild to the mod channel id for that guild
         self.reports = {} # Map from user IDs to the state of their report
         self.mod_reports = {} # Map from mod IDs to the state of their report
-        self.saved_report_history = {} # Map from user IDs to their saved report history
         self.counter = 0 # Counter for reports to have unique IDs
         self.mod_channel = None
-        # Check if reports data file exists
-        if os.path.isfile("saved_report_history.json"):
-            with open("saved_report_history.json", "r") as json_file:
-                json_data = json.load(json_file)
-                self.counter = json_data["counter"]
-                self.saved_report_history = json_data["user_reports"]
-        else:
-            initial_data = {
-                "counter": 0,
-                "user_reports": {}
-            }
-            with open("saved_report_history.json", "w") as json_file:
-                json.dump(initial_data, json_file)
-            self.counter = initial_data["counter"]
-            self.saved_report_history = initial_data["user_reports"]   
+        # Profile metadata indexed by username and user ID, and scammer probabilities from the exported profile model.
+        # Both are loaded in the background during login and reloaded when their files change (see setup_hook), so
+        # always read them through self. Until then nobody has metadata or a score.
+        self.user_metadata = MetadataService()
+        self.scammer_scorer = ScammerScorer(self.user_metadata)
+        # Vertex by default, set CLASSIFIER_BACKEND=offline to run without network access
+        self.classifier_backend = make_backend()
+        # The breaker sits inside the rate limiter so it only times the backend, not quota waits and retry backoff
+        self.classifier = BatchingClassifier(AsyncClassifier(RateLimitedBackend(CircuitBreaker(self.classifier_backend))))
+        # Cache of past classifications, seeded from the evaluation results on first run
+        self.classification_cache = ClassificationCache(self.classifier_backend.name).load()
+        if not self.classification_cache.entries:
+            self.classification_cache.seed_from_csv()
+        # Local first stage that answers confidently benign or spam messages without calling Vertex (trained in setup_hook)
+        self.local_classifier = LocalClassifier()
+        # Phrase matcher that catches obvious attempts to move off the platform before any model runs
+        self.platform_matcher = PlatformMatcher()
+        # Clusters of near-duplicate messages, so copies of a campaign share one verdict and one report
+        self.near_duplicates = NearDuplicateIndex()
+        # Recent messages per channel, sent to Vertex as context for each new message
+        self.conversation_context = ConversationContext()
+        # Channel messages wait here for classification, riskiest first
+        self.classification_queue = ClassificationQueue(self.handle_channel_message)
+        # In-memory index of saved reports, written through to the report store (see report_store.py)
+        self.report_index = ReportIndex(make_report_store())
+        self.counter = self.report_index.load()
+        # Rendered entries for the moderator report queues, shared by every Report_Mod
+        self.report_fragments = ReportFragments(self.report_index)
+        # Users and DM channels for notifications, so repeat notifications skip the REST lookup
+        self.user_cache = UserCache(self)
+        # Runs each user's DMs and mod channel messages in order, and different users' in parallel
+        self.dispatcher = UserDispatcher()
+        startup.mark("init")
+
+
+    def load_user_scoring(self):
+        # Built together so a reload always swaps in a scorer that matches the metadata
+        user_metadata = MetadataService().load()
+        return user_metadata, ScammerScorer(user_metadata).load()
+
+
+    def swap_user_scoring(self, user_scoring):
+        self.user_metadata, self.scammer_scorer = user_scoring
+
+
+    async def load_user_scoring_in_background(self):
+        self.swap_user_scoring(await startup.run_in_background("user_scoring", self.load_user_scoring))
+
+
+    async def setup_hook(self):
+        startup.mark("login")
+        # Slow setup runs on threads while the gateway connects instead of delaying it
+        asyncio.ensure_future(startup.run_in_background("local_classifier", self.local_classifier.train))
+        asyncio.ensure_future(startup.run_in_background("classifier_backend", self.classifier_backend.warm_up))
+        asyncio.ensure_future(self.load_user_scoring_in_background())
+        # Pick up a new metadata.csv or scammer model without restarting and dropping in-progress reports
+        self.user_scoring_watcher = ArtifactWatcher([METADATA_PATH, SCAMMER_MODEL_PATH], self.load_user_scoring, self.swap_user_scoring)
+        self.user_scoring_watcher.start()
+
+
+    async def close(self):
+        # Flush any pending report writes and the classification cache before disconnecting, and disconnect even if that fails
+        try:
+            await self.report_index.durable()
+            self.classification_cache.save()
+            await self.classification_cache.persistence.durable()
+        finally:
+            await super().close()
 
 
     async def on_ready(self):
@@ -89,6 +152,9 @@ class ModBot(discord.Client):
                 if channel.name == f'group-{self.group_num}-mod':
                     self.mod_channels[guild.id] = channel
                     self.mod_channel = channel
+        if not startup.reported:
+            startup.mark("gateway")
+            startup.ready()
         
 
     async def on_message(self, message):
@@ -104,11 +170,16 @@ class ModBot(discord.Client):
         if message.guild:
             # Forward mod messages to mod channel
             if message.channel.name == f'group-{self.group_num}-mod':
-                await self.handle_mod_channel_message_reply(message)
-            else:
-                await self.handle_channel_message(message)
+                self.dispatcher.submit(message.author.id, self.handle_mod_channel_message_reply, message)
+            # Only handle messages sent in the "group-#" channel
+            elif message.channel.name == f'group-{self.group_num}':
+                # The conversation so far, taken before this message is added to it. Done here, in arrival order, since
+                # the queue's workers handle messages riskiest first; shed messages still count as conversation.
+                context = self.conversation_context.window(message.channel.id)
+                self.conversation_context.append(message.channel.id, message.author.name, message.content)
+                self.classification_queue.put(message, self.message_risk(message), context)
         else:
-            await self.handle_dm(message)
+            self.dispatcher.submit(message.author.id, self.handle_dm, message)
 
     async def handle_dm(self, message):
         # Handle a help message
@@ -131,8 +202,7 @@ class ModBot(discord.Client):
 
         # Let the report class handle this message; forward all the messages it returns to us
         responses = await self.reports[author_id].handle_message(message)
-        for r in responses:
-            await message.channel.send(r)
+        await send_all(message.channel, responses)
 
         # If the report is complete or cancelled, remove it from our map
         if author_id in self.reports and self.reports[author_id].report_complete():
@@ -146,22 +216,10 @@ class ModBot(discord.Client):
             # Formart report details
             report_details_formatted = "\n".join([f"{i}:   *{j}*" for i, j in report_details.items()])
             # Send report to mod channel
-            await self.mod_channel.send(f"🚨__**Reported Message:**__🚨\n{report_details_formatted}")
-
-            # Save report to JSON file
-            # Check if individual has a saved report history (they have been reported before)
-            reported_user = report_details["Reported user"]
-            if reported_user not in self.saved_report_history:
-                self.saved_report_history[reported_user] = []
-            # Append report to user's report history
-            self.saved_report_history[reported_user].append(report_details)
-            # Save data to JSON file
-            data_to_save = {
-                "counter": self.counter,
-                "user_reports": self.saved_report_history
-            }
-            with open("saved_report_history.json", "w") as json_file:
-                json.dump(data_to_save, json_file, indent=4)
+            await send_all(self.mod_channel, [f"🚨__**Reported Message:**__🚨\n{report_details_formatted}"])
+
+            # Append report to the reported user's saved report history
+            self.report_index.add_report(report_details, self.counter)
 
 
     async def handle_mod_channel_message_reply(self, message):
@@ -173,6 +231,10 @@ class ModBot(discord.Client):
             await message.reply(reply)
             return
 
+        if message.content == STATS_KEYWORD:
+            await message.reply(metrics.format())
+            return
+
         author_id = message.author.id
         responses = []
 
@@ -186,8 +248,7 @@ class ModBot(discord.Client):
 
         # Let the report class handle this message; forward all the messages it returns to us
         responses = await self.mod_reports[author_id].handle_message(message)
-        for r in responses:
-            await message.channel.send(r)
+        await send_all(message.channel, responses)
 
         # If the report is complete or cancelled, remove it from our map
         if author_id in self.mod_reports and self.mod_reports[author_id].report_complete():
@@ -198,90 +259,133 @@ class ModBot(discord.Client):
             self.mod_reports.pop(author_id)
 
 
-    async def handle_channel_message(self, message):
-        # Only handle messages sent in the "group-#" channel
-        if not message.channel.name == f'group-{self.group_num}':
-            return
+    def message_risk(self, message):
+        '''Risk score in [0, 1] for ordering the classification queue: the author's scammer probability or their report history.'''
+        name = message.author.name
+        probability_scammer = self.scammer_scorer.score(message.author) or 0.0
+        # Three reports get a user banned, so three prior reports count as certain risk
+        return max(probability_scammer, min(1.0, self.report_index.get_user_report_count(name) / 3))
 
+
+    async def handle_channel_message(self, message, context):
         mod_channel = self.mod_channels[message.guild.id]
         print(f"****{type(mod_channel)}****")
 
         # Analyze message and user
         report_details = {}
-        scores = self.eval_text(message.content)
-        name = message.author.name
-        if name in metadata["name"].values:
-            row = metadata[metadata["name"] == name]
-            probability_scammer = row["probability_scammer"].values[0]
-            suspicion_score = row["probability_scammer"].values[0]
-            report_details["Suspicion score"] = suspicion_score
-
-            # If suspicious user is attempting to move off platform, warn user they matched with
-            if suspicion_score > 0.5 and scores.strip() == "trying to move someone onto a different platform":
-                # Notifying the reported user as a proxy for notifing their match
-                user = await client.fetch_user(message.author.id)
-                if user:
-                    await user.send(f"Hi! We've noticed that your match may be trying to move the conversation off the platform, so be cautious about sharing personal contact details or moving conversations off this platform with users you don't know well. Stay safe and happy dating!")
+        suspicion_score = self.scammer_scorer.score(message.author)
+        # Obvious off-platform solicitations ("add me on WhatsApp") warn the match right away, before any model runs. The
+        # message is still classified below, so a threat or spam that comes with contact details is still reported.
+        warned = False
+        if self.platform_matcher.match(message.content)[0]:
+            warned = await self.warn_off_platform(message, suspicion_score)
+        # Messages that join a cluster of near-duplicates reuse its verdict instead of being classified again. A message
+        # that starts a cluster settles it below; copies that arrive before then wait for its verdict. Messages too
+        # short to compare get no cluster.
+        cluster, is_new = self.near_duplicates.lookup(message.content)
+        pending, shared_verdict = (cluster if is_new else None), None
+        try:
+            scores, degraded = (await cluster.wait() if cluster and not is_new else None), False
+            if scores is None:
+                scores, degraded, from_context = await self.eval_text(message.content, context)
+                # Only concerning verdicts are shared: grouping a campaign into one report is what clusters are for,
+                # and a benign label handed to a near-copy could hide a threat. Fallback labels aren't reliable enough,
+                # and verdicts that relied on this conversation don't hold for copies elsewhere (as in the cache).
+                if is_new and not degraded and not from_context and self.is_concerning(scores):
+                    shared_verdict = scores
                 else:
-                    print(f"Failed to find user with ID {user_id}")
-
-        # If concerning content, create a report
-        scores = (scores.strip()).lower()
-        if scores != "not concerning content" and scores != "trying to move someone onto a different platform":
-            report_details["Reported user ID"] = message.author.id
-            report_details["Reported user"] = message.author.name 
-            report_details["Reported by"] = "Auto report"
-            report_details["Status"] = "Open"
-            report_details["Priority"] = "NULL"
-            report_details["Message Content"] = message.content
-            report_details["Message ID"] = message.id
-            report_details["Channel ID"] = message.channel.id
-            report_details["Reported Reason"] = scores
-
-            # Save report to JSON file
-            # Check if individual has a saved report history (they have been reported before)
-            reported_user = report_details["Reported user"]
-            if reported_user not in self.saved_report_history:
-                self.saved_report_history[reported_user] = []
-            # Append report to user's report history
-            report_details["ID"] = self.counter
-            self.counter += 1
-            self.saved_report_history[reported_user].append(report_details)
-            
-            num_reports = len(self.saved_report_history[reported_user])
-            print(f"User {reported_user} has been reported {num_reports} times.")
-        
-            # Save data to JSON file
-            data_to_save = {
-                "counter": self.counter,
-                "user_reports": self.saved_report_history
-            }
-            with open("saved_report_history.json", "w") as json_file:
-                json.dump(data_to_save, json_file, indent=4)
-
-            # Forward the report to the mod channel
-            report_details_formatted = "\n".join([f"{i}:   *{j}*" for i, j in report_details.items()])
-            await self.mod_channel.send(f"🚨__**Reported Message:**__🚨\n{report_details_formatted}")
+                    cluster = None
+            if suspicion_score is not None:
+                report_details["Suspicion score"] = suspicion_score
+
+                # Off-platform attempts only the classifier caught get their warning now
+                if not warned and scores.strip() == PLATFORM_CATEGORY:
+                    await self.warn_off_platform(message, suspicion_score)
+
+            # If concerning content, create a report
+            if self.is_concerning(scores):
+                scores = (scores.strip()).lower()
+                # Later copies of a campaign are added to its open report rather than posted to the mod channel again
+                if cluster:
+                    cluster.users.add(message.author.name)
+                    if cluster.report_id is not None and self.report_index.get_report(cluster.report_id):
+                        self.report_index.set_report_val(cluster.report_id, "Campaign messages", cluster.size)
+                        self.report_index.set_report_val(cluster.report_id, "Campaign users", ", ".join(sorted(cluster.users)))
+                        return
+                report_details["Reported user ID"] = message.author.id
+                report_details["Reported user"] = message.author.name 
+                report_details["Reported by"] = "Auto report"
+                report_details["Status"] = "Open"
+                report_details["Priority"] = "NULL"
+                report_details["Message Content"] = message.content
+                report_details["Message ID"] = message.id
+                report_details["Channel ID"] = message.channel.id
+                report_details["Reported Reason"] = scores
+                if degraded:
+                    report_details["Degraded classification"] = "Vertex unavailable, labelled by the local fallback model"
+
+                # Append report to the reported user's saved report history
+                reported_user = report_details["Reported user"]
+                report_details["ID"] = self.counter
+                self.counter += 1
+                self.report_index.add_report(report_details, self.counter)
+                if cluster:
+                    cluster.report_id = report_details["ID"]
+                
+                num_reports = self.report_index.get_user_report_count(reported_user)
+                print(f"User {reported_user} has been reported {num_reports} times.")
+
+                # Forward the report to the mod channel
+                report_details_formatted = "\n".join([f"{i}:   *{j}*" for i, j in report_details.items()])
+                await send_all(self.mod_channel, [f"🚨__**Reported Message:**__🚨\n{report_details_formatted}"])
+        finally:
+            # Settled once the report is filed, so waiting copies add themselves to it instead of filing their own
+            if pending:
+                self.near_duplicates.settle(pending, shared_verdict)
+
+
+    async def warn_off_platform(self, message, suspicion_score):
+        '''If a suspicious user is attempting to move off platform, warn the user they matched with. Return whether they were warned.'''
+        if suspicion_score is None or suspicion_score <= 0.5:
+            return False
+        # Notifying the reported user as a proxy for notifing their match
+        await self.user_cache.send_dm(message.author.id, f"Hi! We've noticed that your match may be trying to move the conversation off the platform, so be cautious about sharing personal contact details or moving conversations off this platform with users you don't know well. Stay safe and happy dating!")
+        return True
+
+
+    def is_concerning(self, scores):
+        scores = scores.strip().lower()
+        return scores != "not concerning content" and scores != PLATFORM_CATEGORY
 
     
-    def eval_text(self, message):
+    async def eval_text(self, message, context=None):
         ''''
         TODO: Once you know how you want to evaluate messages in your channel, 
         insert your code here! This will primarily be used in Milestone 3. 
         '''
-        # API prompt
-        auto_report_prompt = "You are reading a message on an online dating platform. You are scanning the message for concerning content. It is vital that you correctly identify whether or not this message is concerning. Please classify the message into one of the following categories: 'not concerning content,' 'imminent danger,' 'inauthentic or underage profile,' 'spam or scam,' 'inappropriate or offensive content,' 'trying to move someone onto a different platform,' or 'other concerning content'. Please be picky about what you flag as concerning content. Assume you are only seeing one isolated message in a long conversation. If the message is not concerning, please say 'not concerning content'. Provide your answer only as the category name. Do not respond with anything other than the category name, without any quotes or special characters. Here is the message: "
-        full_prompt = auto_report_prompt + message
-
-        # Generate model response
-        auto_report = model.generate_content(full_prompt)
-        response = ""
+        # Returns the category, whether it came from the degraded-mode fallback and whether it relied on the context
+        # Repeated messages (e.g. spam templates) reuse their earlier classification, and the local first stage answers
+        # confident ones. Both judge the text alone, so with a conversation to go on they may only flag a message: one
+        # that looks harmless on its own (e.g. grooming) still goes to the model with its context.
+        cached = self.classification_cache.get(message)
+        if cached and (not context or self.is_concerning(cached)):
+            return cached, False, False
+        local = self.local_classifier.classify(message)
+        if local and (not context or self.is_concerning(local)):
+            return local, False, False
+        # Escalate uncertain messages to the Vertex model (batched with other recent messages) without blocking the event loop
         try:
-            response = auto_report.text
-        except ValueError: 
-            response = "general"
-
-        return response
+            response = await self.classifier.classify(message, context)
+        except Exception as e:
+            # Vertex is down, too slow or out of retries: fall back to the local model's best guess
+            print(f"Classifying with the local fallback: {e!r}")
+            metrics.incr("classifier.degraded")
+            return self.local_classifier.predict(message)[0], True, False
+        # Verdicts the model says depended on the conversation aren't valid for the message text on its own
+        response, from_context = split_context_flag(response)
+        if not from_context:
+            self.classification_cache.put(message, response)
+        return response, False, from_context
 
     
     def code_format(self, text):
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import deque
+from classifier import AUTO_REPORT_PROMPT
+from classifier_backends import ClassifierBackend
+from metrics import metrics
+
+# Number of recent calls the breaker judges the backend on
+WINDOW = 50
+# Fewest calls in the window before the breaker may trip
+MIN_CALLS = 10
+# Trip when more than this fraction of recent calls failed...
+ERROR_RATE_THRESHOLD = 0.5
+# ...or when the 95th percentile latency of recent calls exceeds this (seconds)
+P95_LATENCY_THRESHOLD = 10.0
+# How often to probe the backend while the breaker is open (seconds)
+PROBE_INTERVAL = 30.0
+PROBE_PROMPT = AUTO_REPORT_PROMPT + "Hey, how was your weekend?"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(ClassifierBackend):
+    '''
+    Stops sending requests to a classifier backend that is failing or slow. When the error rate or p95 latency of
+    the last WINDOW calls crosses its threshold the breaker opens and calls fail fast with CircuitOpenError, so the
+    caller can use a fallback. Calls that take longer than the latency threshold are cut off and count as failures,
+    so a hung backend trips the breaker too. While open, a background task probes the backend and closes the breaker
+    once it answers within the latency threshold again.
+
+    The breaker should wrap the model backend directly, inside any rate limiting, so quota waits and retry backoff
+    aren't mistaken for a slow backend.
+    '''
+
+    def __init__(self, backend, window=WINDOW, min_calls=MIN_CALLS, error_rate_threshold=ERROR_RATE_THRESHOLD,
+                 p95_latency_threshold=P95_LATENCY_THRESHOLD, probe_interval=PROBE_INTERVAL):
+        self.backend = backend
+        self.calls = deque(maxlen=window) # (succeeded, latency) of recent calls
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.p95_latency_threshold = p95_latency_threshold
+        self.probe_interval = probe_interval
+        self.is_open = False
+        self.probe_task = None
+
+    async def generate_async(self, prompt):
+        if self.is_open:
+            raise CircuitOpenError("Classifier backend is unavailable")
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self.backend.generate_async(prompt), self.p95_latency_threshold)
+        except ValueError:
+            # A safety block is still an answer from a healthy backend
+            self.record(True, time.monotonic() - start)
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(True, time.monotonic() - start)
+        return response
+
+    def generate(self, prompt):
+        # Offline scripts call the backend directly and have no fallback to route to
+        return self.backend.generate(prompt)
+
+    def p95_latency(self):
+        latencies = sorted(latency for _, latency in self.calls)
+        return latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+
+    def error_rate(self):
+        return sum(1 for succeeded, _ in self.calls if not succeeded) / len(self.calls) if self.calls else 0.0
+
+    def record(self, succeeded, latency):
+        self.calls.append((succeeded, latency))
+        metrics.set("classifier.p95_latency", self.p95_latency())
+        if self.is_open or len(self.calls) < self.min_calls:
+            return
+        if self.error_rate() > self.error_rate_threshold or self.p95_latency() > self.p95_latency_threshold:
+            self.trip()
+
+    def trip(self):
+        self.is_open = True
+        metrics.incr("classifier.circuit_trips")
+        metrics.set("classifier.circuit_open", 1)
+        print(f"Classifier circuit opened (error rate {self.error_rate():.0%}, p95 latency {self.p95_latency():.1f}s)")
+        self.probe_task = asyncio.ensure_future(self.probe())
+
+    async def probe(self):
+        while self.is_open:
+            await asyncio.sleep(self.probe_interval)
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self.backend.generate_async(PROBE_PROMPT), self.p95_latency_threshold)
+            except ValueError:
+                pass
+            except Exception:
+                continue
+            self.close()
+
+    def close(self):
+        self.is_open = False
+        self.calls.clear()
+        metrics.set("classifier.circuit_open", 0)
+        print("Classifier circuit closed")
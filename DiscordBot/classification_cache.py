@@ -0,0 +1,97 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from classifier import CATEGORIES, PROMPT_VERSION, extract_category, normalize_text
+from metrics import metrics
+from persistence import PersistenceWorker
+
+CACHE_PATH = "classification_cache.json"
+# Kept apart from the bot's cache, so evaluation runs can't plant verdicts the live bot then serves
+EVAL_CACHE_PATH = "eval_classification_cache.json"
+SEED_PATH = "datasets/vertex_results.csv"
+# Most cached classifications kept
+CACHE_SIZE = 50000
+# How long a cached classification stays valid (seconds)
+CACHE_TTL = 7 * 24 * 60 * 60
+# Save the cache to disk after this many new entries
+SAVE_EVERY = 100
+
+
+def cache_key(text, namespace=""):
+    # Normalize the same way model responses are normalized, and collapse whitespace
+    return hashlib.sha1((namespace + "\n" + " ".join(normalize_text(text).split())).encode("utf-8")).hexdigest()
+
+
+def write_cache(path, entries):
+    with open(path + ".tmp", "w") as json_file:
+        json.dump(entries, json_file)
+    os.replace(path + ".tmp", path)
+
+
+class ClassificationCache:
+    '''
+    Content-addressed cache of message classifications, so repeated spam and scam templates are only sent to the
+    model once. Keys include the backend that produced the verdict and the prompt version, so switching either starts
+    from an empty cache rather than replaying old answers. Entries are evicted least recently used first and expire
+    after ttl seconds. The cache is saved to disk in the background and reloaded on startup.
+    '''
+
+    def __init__(self, backend_name, path=CACHE_PATH, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.namespace = f"{backend_name}/{PROMPT_VERSION}"
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict() # Map from cache key to [category, time cached], least recently used first
+        self.unsaved = 0
+        self.persistence = PersistenceWorker()
+
+    def load(self):
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as json_file:
+                self.entries = OrderedDict(json.load(json_file))
+        return self
+
+    def seed_from_csv(self, csv_file_path=SEED_PATH):
+        '''Pre-seed with past evaluation results (message, label, predicted_label), e.g. datasets/vertex_results.csv.'''
+        with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+            for row in csv.DictReader(csv_file):
+                self.put(row["message"], row["predicted_label"], save=False)
+
+    def get(self, text):
+        key = cache_key(text, self.namespace)
+        entry = self.entries.get(key)
+        if entry and time.time() - entry[1] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry:
+            self.entries.move_to_end(key)
+            metrics.incr("classification_cache.hits")
+        else:
+            metrics.incr("classification_cache.misses")
+        metrics.set("classification_cache.hit_rate", metrics.rate("classification_cache.hits", "classification_cache.misses"))
+        return entry[0] if entry else None
+
+    def put(self, text, response, save=True):
+        category = extract_category(response)
+        # Only cache real verdicts, errors and safety blocks should be retried
+        if category not in CATEGORIES or category == "vertex safety error":
+            return
+        key = cache_key(text, self.namespace)
+        self.entries[key] = [category, time.time()]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        metrics.set("classification_cache.size", len(self.entries))
+        self.unsaved += 1
+        if save and self.unsaved >= SAVE_EVERY:
+            self.save()
+
+    def save(self):
+        self.unsaved = 0
+        self.persistence.submit(write_cache, self.path, list(self.entries.items()))
+
+    def hit_rate(self):
+        return metrics.rate("classification_cache.hits", "classification_cache.misses")
@@ -0,0 +1,69 @@
+import asyncio
+import heapq
+import itertools
+import time
+from metrics import metrics
+
+# Messages handled at once (enough to fill the classifier's batches and concurrent requests)
+NUM_WORKERS = 32
+# Past this many waiting messages, low-risk messages are deferred behind everything riskier...
+HIGH_WATER = 200
+# ...where "low-risk" means a risk score below this
+LOW_RISK = 0.2
+# Most messages waiting at once; past this the lowest-risk message is shed
+MAX_QUEUE_SIZE = 1000
+
+
+class ClassificationQueue:
+    '''
+    Bounded priority queue between message intake and classification, so a burst of messages can't pile up unbounded
+    coroutines. Messages are handled riskiest first, and in arrival order among equal risks. Once the backlog passes
+    high_water, messages below LOW_RISK are deferred until nothing riskier is waiting, even messages that arrive
+    later; once it reaches max_size the lowest-risk message is shed (dropped without being classified). Depth, wait
+    times, deferrals and shed counts are recorded in the metrics.
+    '''
+
+    def __init__(self, handler, num_workers=NUM_WORKERS, high_water=HIGH_WATER, max_size=MAX_QUEUE_SIZE):
+        self.handler = handler # Coroutine function called with each message and the arguments queued with it
+        self.num_workers = num_workers
+        self.high_water = high_water
+        self.max_size = max_size
+        self.heap = [] # (-priority, arrival order, time queued, risk, message, handler arguments)
+        self.order = itertools.count()
+        self.ready = None
+        self.workers = []
+
+    def put(self, message, risk, *args):
+        '''Queue a message with a risk score in [0, 1], and any further arguments to hand the handler with it.'''
+        if not self.workers:
+            self.ready = asyncio.Event()
+            self.workers = [asyncio.ensure_future(self.work()) for _ in range(self.num_workers)]
+        # Risky messages always jump the queue; low-risk ones only lose their place once the backlog is deep
+        priority = risk if risk >= LOW_RISK or len(self.heap) < self.high_water else risk - 1
+        if len(self.heap) >= self.max_size:
+            lowest = max(range(len(self.heap)), key=lambda i: self.heap[i][:2])
+            if self.heap[lowest][0] <= -priority:
+                metrics.incr("classification_queue.shed")
+                return
+            self.heap[lowest] = self.heap[-1]
+            self.heap.pop()
+            heapq.heapify(self.heap)
+            metrics.incr("classification_queue.shed")
+        elif priority < 0:
+            metrics.incr("classification_queue.deferred")
+        heapq.heappush(self.heap, (-priority, next(self.order), time.monotonic(), risk, message, args))
+        metrics.set("classification_queue.depth", len(self.heap))
+        self.ready.set()
+
+    async def work(self):
+        while True:
+            while not self.heap:
+                self.ready.clear()
+                await self.ready.wait()
+            _, _, queued, _, message, args = heapq.heappop(self.heap)
+            metrics.set("classification_queue.depth", len(self.heap))
+            metrics.observe("classification_queue.wait", time.monotonic() - queued)
+            try:
+                await self.handler(message, *args)
+            except Exception as e:
+                print(f"Error handling queued message: {e!r}")
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import re
+import string
+
+# Most Vertex classification requests allowed in flight at once
+MAX_CONCURRENT_CLASSIFICATIONS = 8
+# Most messages classified in one batched request
+BATCH_SIZE = 10
+# Longest a message waits for its batch to fill before the batch is sent anyway (seconds)
+BATCH_MAX_WAIT = 0.2
+
+CATEGORY_INSTRUCTIONS = "You are reading a message on an online dating platform. You are scanning the message for concerning content. It is vital that you correctly identify whether or not this message is concerning. Please classify the message into one of the following categories: 'not concerning content,' 'imminent danger,' 'inauthentic or underage profile,' 'spam or scam,' 'inappropriate or offensive content,' 'trying to move someone onto a different platform,' or 'other concerning content'. Please be picky about what you flag as concerning content. Assume you are only seeing one isolated message in a long conversation. If the message is not concerning, please say 'not concerning content'. "
+AUTO_REPORT_PROMPT = CATEGORY_INSTRUCTIONS + "Provide your answer only as the category name. Do not respond with anything other than the category name, without any quotes or special characters. Here is the message: "
+# Added after a category when the verdict relied on the earlier messages, so it isn't reused for the text on its own
+CONTEXT_FLAG = "(context)"
+CONTEXT_INSTRUCTIONS = CATEGORY_INSTRUCTIONS.replace("Assume you are only seeing one isolated message in a long conversation. ", "Some messages come with the most recent earlier messages in their conversation for context. Classify only the message itself, but use its earlier messages to recognize patterns that build up over several messages, such as grooming or a developing scam. ")
+# Prompt for a message classified together with the conversation leading up to it
+CONTEXT_PROMPT = CONTEXT_INSTRUCTIONS + f"Provide your answer only as the category name, followed by ' {CONTEXT_FLAG}' if you could only reach it because of the earlier messages. Do not respond with anything else, without any quotes or special characters. Here are the earlier messages:\n"
+CONTEXT_MESSAGE_MARKER = "\nHere is the message to classify: "
+BATCH_PROMPT = CATEGORY_INSTRUCTIONS + "You will be given several numbered messages. Classify each one independently of the others. Respond with exactly one line per message in the form '<number>. <category name>', without any quotes or special characters and nothing else. Here are the messages:\n"
+# Batched prompt where messages may come with their own earlier messages, listed just above them as "[<number> earlier] author: text"
+BATCH_CONTEXT_PROMPT = CONTEXT_INSTRUCTIONS + f"You will be given several numbered messages, some preceded by lines marked '[<number> earlier]' holding the earlier messages of that message's conversation. Classify each numbered message independently of the others, using only its own earlier messages. Respond with exactly one line per numbered message in the form '<number>. <category name>', followed by ' {CONTEXT_FLAG}' if you could only reach it because of its earlier messages, without any quotes or special characters and nothing else. Here are the messages:\n"
+# Changes whenever any prompt does, so verdicts cached under an older prompt aren't reused
+PROMPT_VERSION = hashlib.sha1((AUTO_REPORT_PROMPT + CONTEXT_PROMPT + BATCH_PROMPT + BATCH_CONTEXT_PROMPT).encode("utf-8")).hexdigest()[:8]
+
+CATEGORIES = [
+    'not concerning content', 
+    'imminent danger', 
+    'inauthentic or underage profile', 
+    'spam or scam', 
+    'inappropriate or offensive content', 
+    'trying to move someone onto a different platform', 
+    'other concerning content',
+    'vertex safety error'
+]
+
+
+def normalize_text(text):
+    return text.strip().lower().strip(string.punctuation).rstrip(string.punctuation)
+
+
+def split_context_flag(response):
+    '''Return (response without CONTEXT_FLAG, whether the verdict relied on the earlier messages).'''
+    if CONTEXT_FLAG in response.lower():
+        return re.sub(re.escape(CONTEXT_FLAG), "", response, flags=re.IGNORECASE).strip(), True
+    return response, False
+
+
+def extract_category(evaluation_result):
+    normalized_result = normalize_text(evaluation_result)
+    for category in CATEGORIES:
+        if category in normalized_result:
+            return category
+    return "error"
+
+
+class AsyncClassifier:
+    '''
+    Classifies messages with a classifier backend (see classifier_backends.py) without blocking the event loop.
+    Requests use the backend's async API and at most max_concurrent of them are in flight at once; the rest wait
+    their turn.
+    '''
+
+    def __init__(self, backend, max_concurrent=MAX_CONCURRENT_CLASSIFICATIONS):
+        self.backend = backend
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def generate(self, prompt):
+        async with self.semaphore:
+            try:
+                return await self.backend.generate_async(prompt)
+            except ValueError:
+                return "general"
+
+    async def classify(self, message, context=None):
+        '''Classify a message, optionally alongside the earlier messages of its conversation ("author: text" lines).'''
+        if context:
+            return await self.generate(CONTEXT_PROMPT + "\n".join(context) + CONTEXT_MESSAGE_MARKER + message)
+        return await self.generate(AUTO_REPORT_PROMPT + message)
+
+    async def classify_batch(self, messages):
+        '''
+        Classify several (message, context) pairs with one request, each message alongside its own context (None for
+        none). Returns one category per message, in order.
+        '''
+        if len(messages) == 1:
+            return [await self.classify(*messages[0])]
+        lines = []
+        for i, (message, context) in enumerate(messages):
+            lines.extend(f"[{i + 1} earlier] {line}" for line in context or [])
+            lines.append(f"{i + 1}. {' '.join(message.split())}")
+        prompt = BATCH_CONTEXT_PROMPT if any(context for _, context in messages) else BATCH_PROMPT
+        response = await self.generate(prompt + "\n".join(lines))
+        results = [None] * len(messages)
+        for line in response.splitlines():
+            m = re.match(r'\s*(\d+)[.):]\s*(.+)', line)
+            if m and 1 <= int(m.group(1)) <= len(messages):
+                results[int(m.group(1)) - 1] = m.group(2)
+        # Anything the batched response didn't answer is classified on its own
+        missing = [i for i, result in enumerate(results) if result is None]
+        for i, result in zip(missing, await asyncio.gather(*[self.classify(*messages[i]) for i in missing])):
+            results[i] = result
+        return results
+
+
+class BatchingClassifier:
+    '''
+    Collects messages for up to max_wait seconds or batch_size messages, classifies them in one request and hands each
+    waiting caller its own category. Messages with conversation context are batched too, each sent with its own window.
+    '''
+
+    def __init__(self, classifier, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.pending = [] # (message, context, future) waiting for the next batch
+        self.timer = None
+
+    async def classify(self, message, context=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((message, context, future))
+        if len(self.pending) >= self.batch_size:
+            self.dispatch()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.dispatch)
+        return await future
+
+    def dispatch(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            batch, self.pending = self.pending, []
+            asyncio.ensure_future(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        try:
+            results = await self.classifier.classify_batch([(message, context) for message, context, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,143 @@
+import asyncio
+import csv
+import hashlib
+import os
+import re
+import time
+from classifier import AUTO_REPORT_PROMPT, BATCH_CONTEXT_PROMPT, BATCH_PROMPT, CATEGORIES, CONTEXT_MESSAGE_MARKER, CONTEXT_PROMPT, normalize_text
+
+# Which backend classifies messages: "vertex" or "offline"
+CLASSIFIER_BACKEND = os.environ.get("CLASSIFIER_BACKEND", "vertex")
+VERTEX_PROJECT_ID = os.environ.get("VERTEX_PROJECT_ID", "cs152-bot-424101") # Gabbys project ID
+VERTEX_LOCATION = "us-central1"
+VERTEX_MODEL_NAME = "gemini-1.0-pro-002"
+# Recorded model responses the offline backend replays
+RECORDED_RESPONSES = "datasets/vertex_results.csv"
+# Simulated round trip of the offline backend (seconds)
+OFFLINE_LATENCY = float(os.environ.get("OFFLINE_LATENCY", "0"))
+
+
+def response_key(message):
+    # Whitespace is collapsed since batched prompts send each message on one line (as classification_cache.cache_key does)
+    return " ".join(normalize_text(message).split())
+
+
+class ClassifierBackend:
+    '''
+    Interface for the model that classifies prompts. Both methods return the response text and raise ValueError when
+    the model refuses to answer (as Vertex does for safety blocks).
+    '''
+
+    # Identifies the model behind the backend, so cached verdicts from one model aren't served for another
+    name = None
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt):
+        raise NotImplementedError
+
+    def warm_up(self):
+        '''Do any slow one-off setup now rather than on the first request. Called from a worker thread.'''
+        pass
+
+
+class VertexBackend(ClassifierBackend):
+    '''
+    Google Vertex AI Gemini model. The SDK is imported and initialized on first use, not at import time.
+    '''
+
+    def __init__(self, project_id=VERTEX_PROJECT_ID, location=VERTEX_LOCATION, model_name=VERTEX_MODEL_NAME):
+        self.project_id = project_id
+        self.location = location
+        self.model_name = model_name
+        self.name = f"vertex/{model_name}"
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            import vertexai
+            from vertexai.generative_models import GenerativeModel
+            vertexai.init(project=self.project_id, location=self.location)
+            self._model = GenerativeModel(model_name=self.model_name)
+        return self._model
+
+    def warm_up(self):
+        self.model
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    async def generate_async(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class OfflineBackend(ClassifierBackend):
+    '''
+    Network-free stand-in for Vertex, for running, profiling and load-testing the pipeline locally. Messages found in
+    the recorded responses CSV get their recorded label (recorded safety errors raise ValueError, like Vertex);
+    anything else gets default_label, or a label derived from a hash of the message if default_label is None. Each
+    call sleeps for latency seconds to simulate the round trip.
+    '''
+
+    name = "offline"
+
+    def __init__(self, recorded_csv=RECORDED_RESPONSES, latency=OFFLINE_LATENCY, default_label="not concerning content"):
+        self.latency = latency
+        self.default_label = default_label
+        self.responses = {} # Map from normalized message to recorded label
+        if recorded_csv and os.path.isfile(recorded_csv):
+            with open(recorded_csv, newline="", encoding="utf-8") as csv_file:
+                for row in csv.DictReader(csv_file):
+                    self.responses[response_key(row["message"])] = row["predicted_label"]
+
+    def label(self, message):
+        label = self.responses.get(response_key(message))
+        if label is None:
+            if self.default_label is not None:
+                return self.default_label
+            digest = int(hashlib.sha1(response_key(message).encode("utf-8")).hexdigest(), 16)
+            return CATEGORIES[digest % (len(CATEGORIES) - 1)]
+        if label == "vertex safety error":
+            raise ValueError("Response was blocked by the offline backend's recorded safety error")
+        return label
+
+    def respond(self, prompt):
+        # Batched prompts list numbered messages, one per line. Earlier messages ("[n earlier] ...") are ignored.
+        for batch_prompt in (BATCH_PROMPT, BATCH_CONTEXT_PROMPT):
+            if prompt.startswith(batch_prompt):
+                return self.respond_batch(prompt[len(batch_prompt):].splitlines())
+        # The earlier messages are ignored, only the final message has a recorded label
+        if prompt.startswith(CONTEXT_PROMPT):
+            return self.label(prompt.rpartition(CONTEXT_MESSAGE_MARKER)[2])
+        return self.label(prompt[len(AUTO_REPORT_PROMPT):] if prompt.startswith(AUTO_REPORT_PROMPT) else prompt)
+
+    def respond_batch(self, lines):
+        answers = []
+        for line in lines:
+            m = re.match(r'(\d+)\. (.*)', line)
+            if m:
+                try:
+                    answers.append(f"{m.group(1)}. {self.label(m.group(2))}")
+                except ValueError:
+                    # Leave it out, the caller re-classifies missing lines on their own
+                    pass
+        return "\n".join(answers)
+
+    def generate(self, prompt):
+        time.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
+
+def make_backend(backend=CLASSIFIER_BACKEND, project_id=VERTEX_PROJECT_ID):
+    if backend == "vertex":
+        return VertexBackend(project_id=project_id)
+    if backend == "offline":
+        return OfflineBackend()
+    raise ValueError(f"Unknown classifier backend: {backend}")
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict, deque
+from metrics import metrics
+
+# Most recent messages and characters kept per channel
+CHANNEL_MAX_MESSAGES = 20
+CHANNEL_MAX_CHARS = 4000
+# Characters kept across all channels; least recently active channels are dropped past this
+TOTAL_MAX_CHARS = 2000000
+# Channels with no messages for this long are dropped (seconds)
+IDLE_TTL = 30 * 60
+# Earlier messages sent to the classifier with each new one, and the characters they may take up
+WINDOW_MESSAGES = 6
+WINDOW_CHARS = 800
+# Longest single message kept in the window
+WINDOW_MESSAGE_CHARS = 200
+
+
+class ChannelBuffer:
+    '''
+    Ring buffer of a channel's most recent (author, text) messages, bounded by count and characters.
+    '''
+
+    def __init__(self, max_messages=CHANNEL_MAX_MESSAGES, max_chars=CHANNEL_MAX_CHARS):
+        self.messages = deque()
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.chars = 0
+        self.last_active = time.time()
+
+    def append(self, author, text):
+        '''Add a message and return the number of characters freed by dropping old ones (may be negative).'''
+        text = text[:self.max_chars]
+        freed = -len(text)
+        self.messages.append((author, text))
+        self.chars += len(text)
+        while len(self.messages) > self.max_messages or self.chars > self.max_chars:
+            _, dropped = self.messages.popleft()
+            self.chars -= len(dropped)
+            freed += len(dropped)
+        self.last_active = time.time()
+        return freed
+
+    def window(self, max_messages=WINDOW_MESSAGES, max_chars=WINDOW_CHARS):
+        '''The most recent messages, oldest first, clipped to fit max_chars.'''
+        lines = []
+        chars = 0
+        for author, text in reversed(self.messages):
+            if len(lines) >= max_messages:
+                break
+            text = " ".join(text.split())
+            if len(text) > WINDOW_MESSAGE_CHARS:
+                text = text[:WINDOW_MESSAGE_CHARS] + "..."
+            line = f"{author}: {text}"
+            if chars + len(line) > max_chars:
+                break
+            lines.append(line)
+            chars += len(line)
+        return lines[::-1]
+
+
+class ConversationContext:
+    '''
+    Recent messages per channel, so the classifier can see the conversation a message belongs to (grooming and scams
+    often only show across several messages). Each channel keeps a bounded ring buffer; channels idle for longer
+    than idle_ttl are dropped, and the least recently active channels are dropped whenever the total size goes over
+    max_chars. The window for a new message is built before the message itself is added, so each message is
+    classified once, alongside the messages that came before it.
+    '''
+
+    def __init__(self, max_chars=TOTAL_MAX_CHARS, idle_ttl=IDLE_TTL):
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self.channels = OrderedDict() # Map from channel ID to its buffer, least recently active first
+        self.chars = 0
+
+    def window(self, channel_id):
+        buffer = self.channels.get(channel_id)
+        return buffer.window() if buffer else []
+
+    def append(self, channel_id, author, text):
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            buffer = self.channels[channel_id] = ChannelBuffer()
+        self.channels.move_to_end(channel_id)
+        self.chars -= buffer.append(author, text)
+        self.evict()
+
+    def evict(self):
+        cutoff = time.time() - self.idle_ttl
+        while self.channels:
+            channel_id, oldest = next(iter(self.channels.items()))
+            if oldest.last_active >= cutoff and self.chars <= self.max_chars:
+                break
+            self.chars -= oldest.chars
+            del self.channels[channel_id]
+            metrics.incr("conversation_context.evictions")
+        metrics.set("conversation_context.channels", len(self.channels))
+        metrics.set("conversation_context.chars", self.chars)
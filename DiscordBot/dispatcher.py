@@ -0,0 +1,43 @@
+import asyncio
+from metrics import metrics
+
+# How long a user's worker waits for another message before it is torn down (seconds)
+IDLE_TIMEOUT = 60.0
+
+
+class UserDispatcher:
+    '''
+    Runs each user's messages strictly one after another, and different users' messages concurrently. Every active
+    user gets a queue and a worker task that handles their messages in arrival order, so two quick DMs can't
+    interleave inside the same Report or Report_Mod state machine while a slow step for one user doesn't hold up
+    anyone else. A worker that has been idle for idle_timeout seconds is torn down.
+    '''
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.queues = {} # Map from user ID to the queue of (handler, message) waiting for their worker
+
+    def submit(self, user_id, handler, message):
+        '''Queue await handler(message) behind anything else already waiting for this user.'''
+        queue = self.queues.get(user_id)
+        if queue is None:
+            queue = self.queues[user_id] = asyncio.Queue()
+            asyncio.ensure_future(self.work(user_id, queue))
+            metrics.set("dispatcher.active_users", len(self.queues))
+        queue.put_nowait((handler, message))
+
+    async def work(self, user_id, queue):
+        while True:
+            try:
+                handler, message = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # submit() can't run between this check and the removal, so nothing is left behind
+                if queue.empty():
+                    del self.queues[user_id]
+                    metrics.set("dispatcher.active_users", len(self.queues))
+                    return
+                continue
+            try:
+                await handler(message)
+            except Exception as e:
+                print(f"Error handling message from user {user_id}: {e!r}")
@@ -1,6 +1,4 @@
 import pandas as pd
-import vertexai
-from vertexai.generative_models import GenerativeModel
 import string
 import random
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
@@ -9,10 +7,15 @@ import re
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from classifier import AUTO_REPORT_PROMPT, extract_category
+from classifier_backends import make_backend, VertexBackend
+from rate_limit import RateLimitedBackend
+from classification_cache import ClassificationCache, EVAL_CACHE_PATH
 
-project_id = "cs152-424619"  # Giancarlo's project ID
-vertexai.init(project=project_id, location="us-central1")
-model = GenerativeModel(model_name="gemini-1.0-pro-002")
+# Vertex by default, set CLASSIFIER_BACKEND=offline to replay recorded responses instead. The project comes from
+# VERTEX_PROJECT_ID (e.g. VERTEX_PROJECT_ID=cs152-424619 for Giancarlo's project)
+model_backend = make_backend()
+backend = RateLimitedBackend(model_backend)
 
 def evaluate_strings_from_csv(csv_file_path):
     df = pd.read_csv(csv_file_path)
@@ -21,56 +24,32 @@ def evaluate_strings_from_csv(csv_file_path):
         raise ValueError("CSV file must contain 'message' and 'label' columns")
 
     results = []
+    cache = ClassificationCache(model_backend.name, path=EVAL_CACHE_PATH).load()
 
     for _, row in df.iterrows():
         text = row['message']
         label = row['label']
 
-        auto_report_prompt = (
-            "You are reading a message on an online dating platform. You are scanning the message for concerning content. "
-            "It is vital that you correctly identify whether or not this message is concerning. Please classify the message "
-            "into one of the following categories: 'not concerning content,' 'imminent danger,' 'inauthentic or underage profile,' "
-            "'spam or scam,' 'inappropriate or offensive content,' 'trying to move someone onto a different platform,' or 'other concerning content'. "
-            "Please be picky about what you flag as concerning content. Assume you are only seeing one isolated message in a long conversation. "
-            "If the message is not concerning, please say 'not concerning content'. Provide your answer only as the category name. Do not respond with "
-            "anything other than the category name, without any quotes or special characters. Here is the message: "
-        )
-        full_prompt = auto_report_prompt + text
-
-        auto_report = model.generate_content(full_prompt)
-        evaluation_result = ""
-
-        try:
-            evaluation_result = auto_report.text
-        except ValueError:
-            evaluation_result = "vertex safety error"
-        
-        def extract_category(evaluation_result):
-            categories = [
-                'not concerning content', 
-                'imminent danger', 
-                'inauthentic or underage profile', 
-                'spam or scam', 
-                'inappropriate or offensive content', 
-                'trying to move someone onto a different platform', 
-                'other concerning content',
-                'vertex safety error'
-            ]
-            
-            normalized_result = evaluation_result.strip().lower().strip(string.punctuation).rstrip(string.punctuation)
-            for category in categories:
-                if category in normalized_result:
-                    return category
-            return "error"
-        
+        full_prompt = AUTO_REPORT_PROMPT + text
+
+        evaluation_result = cache.get(text)
+        if not evaluation_result:
+            try:
+                evaluation_result = backend.generate(full_prompt)
+            except ValueError:
+                evaluation_result = "vertex safety error"
+            cache.put(text, evaluation_result)
         
         result = extract_category(evaluation_result)
         results.append({'message': text, 'label': label,
                        'predicted_label': result})
 
     results_df = pd.DataFrame(results)
+    cache.save()
+    print(f"Classification cache hit rate: {cache.hit_rate():.2%}")
 
-    results_csv_file_path = 'datasets/vertex_results.csv'
+    # Only real Vertex answers go in vertex_results.csv, which seeds the bot's cache and the offline backend's replies
+    results_csv_file_path = 'datasets/vertex_results.csv' if isinstance(model_backend, VertexBackend) else f'datasets/{model_backend.name}_results.csv'
     results_df.to_csv(results_csv_file_path, index=False)
     print(f"Evaluated results saved to {results_csv_file_path}")
     return results_df
@@ -222,7 +201,8 @@ def main():
     # make_csv(csv_file_path)
     # evaluated_results_df = evaluate_strings_from_csv(csv_file_path)
     # analyze_results(evaluated_results_df)
-    results_csv_file_path = 'datasets/vertex_results.csv'
+    # Only real Vertex answers go in vertex_results.csv, which seeds the bot's cache and the offline backend's replies
+    results_csv_file_path = 'datasets/vertex_results.csv' if isinstance(model_backend, VertexBackend) else f'datasets/{model_backend.name}_results.csv'
     results_df = pd.read_csv(results_csv_file_path)
     analyze_results(results_df)
   
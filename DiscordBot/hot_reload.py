@@ -0,0 +1,61 @@
+import asyncio
+import os
+from metrics import metrics
+
+# How often watched files are checked for changes (seconds)
+RELOAD_POLL_INTERVAL = 5.0
+
+
+def file_signature(paths):
+    '''(modification time, size) of each path, or None for paths that don't exist.'''
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class ArtifactWatcher:
+    '''
+    Rebuilds something from files on disk whenever they change, without restarting the bot. The files are polled
+    every poll_interval seconds; once a change has been stable for one poll (so half-written files aren't read),
+    build() runs on a worker thread and its result is handed to swap() back on the event loop. swap() should just
+    assign the result to the attribute readers use, so lookups never take a lock and see either the old or the new
+    version, never a mix. If build() fails, the old version stays in place.
+    '''
+
+    def __init__(self, paths, build, swap, poll_interval=RELOAD_POLL_INTERVAL):
+        self.paths = paths
+        self.build = build
+        self.swap = swap
+        self.poll_interval = poll_interval
+        self.signature = file_signature(paths)
+        self.pending = None # Signature of a change waiting to settle
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.watch())
+
+    async def watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = file_signature(self.paths)
+            if signature == self.signature:
+                continue
+            if signature != self.pending:
+                self.pending = signature
+                continue
+            self.signature, self.pending = signature, None
+            try:
+                built = await loop.run_in_executor(None, self.build)
+            except Exception as e:
+                print(f"Failed to reload {', '.join(self.paths)}, keeping the current version: {e!r}")
+                metrics.incr("hot_reload.failures")
+                continue
+            self.swap(built)
+            metrics.incr("hot_reload.reloads")
+            print(f"Reloaded {', '.join(self.paths)}")
@@ -0,0 +1,67 @@
+from metrics import metrics
+
+# Labelled messages the local model is trained on
+TRAINING_CSVS = [
+    "datasets/benign.csv",
+    "datasets/spam.csv",
+    "datasets/danger.csv",
+    "datasets/inappropriate.csv",
+    "datasets/inauthentic.csv",
+    "datasets/other.csv",
+    "datasets/platform.csv",
+]
+# What the degraded-mode fallback answers before the model has finished training, so a person takes a look
+UNTRAINED_FALLBACK = "other concerning content"
+# Categories the local model may answer on its own, and how confident it must be to do so.
+# Anything else, or anything less confident, is escalated to the Vertex model.
+LOCAL_THRESHOLDS = {
+    "not concerning content": 0.9,
+    "spam or scam": 0.9,
+}
+
+
+class LocalClassifier:
+    '''
+    CPU-only first stage in front of the Vertex model: a hashed word/bigram vectorizer with a logistic regression,
+    trained on the bundled datasets at startup. Confident answers for the categories in thresholds are returned
+    directly; everything else returns None so the caller escalates it. Training takes several seconds, so the bot
+    runs train() in the background; until it finishes every message is escalated.
+    '''
+
+    def __init__(self, thresholds=LOCAL_THRESHOLDS, training_csvs=TRAINING_CSVS):
+        self.thresholds = thresholds
+        self.training_csvs = training_csvs
+        self.vectorizer = None
+        self.model = None
+        self.trained = False
+
+    def train(self):
+        # sklearn and pandas take a while to import, so they're only loaded once we actually train
+        import pandas as pd
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import LogisticRegression
+        vectorizer = HashingVectorizer(ngram_range=(1, 2), alternate_sign=False, n_features=2 ** 18)
+        model = LogisticRegression(C=10, max_iter=2000, class_weight="balanced")
+        df = pd.concat([pd.read_csv(path) for path in self.training_csvs], ignore_index=True).dropna()
+        model.fit(vectorizer.transform(df["message"].astype(str)), df["label"])
+        self.vectorizer, self.model, self.trained = vectorizer, model, True
+        return self
+
+    def predict(self, message):
+        '''Most likely category and its probability.'''
+        if not self.trained:
+            return UNTRAINED_FALLBACK, 0.0
+        probabilities = self.model.predict_proba(self.vectorizer.transform([message]))[0]
+        best = probabilities.argmax()
+        return self.model.classes_[best], probabilities[best]
+
+    def classify(self, message):
+        if not self.trained:
+            metrics.incr("local_classifier.escalated")
+            return None
+        category, confidence = self.predict(message)
+        if confidence >= self.thresholds.get(category, float("inf")):
+            metrics.incr("local_classifier.answered")
+            return category
+        metrics.incr("local_classifier.escalated")
+        return None
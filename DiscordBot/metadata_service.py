@@ -0,0 +1,76 @@
+from typing import NamedTuple, Optional
+import numpy as np
+
+METADATA_PATH = "datasets/metadata.csv"
+# Map from metadata.csv column to (record field, storage dtype)
+COLUMNS = {
+    "nums/length username": ("nums_length_username", np.float32),
+    "fullname words": ("fullname_words", np.int16),
+    "nums/length fullname": ("nums_length_fullname", np.float32),
+    "name==username": ("name_equals_username", np.int8),
+    "description length": ("description_length", np.int32),
+    "external URL": ("external_url", np.int8),
+    "num_posts": ("num_posts", np.int32),
+    "probability_scammer": ("probability_scammer", np.float64),
+}
+# Optional column with the user's Discord ID
+USER_ID_COLUMN = "user_id"
+
+
+class UserMetadata(NamedTuple):
+    name: str
+    user_id: Optional[int]
+    nums_length_username: float
+    fullname_words: int
+    nums_length_fullname: float
+    name_equals_username: int
+    description_length: int
+    external_url: int
+    num_posts: int
+    probability_scammer: float
+
+
+class MetadataService:
+    '''
+    User profile metadata from metadata.csv, loaded once and shared by everything that looks users up. Each column
+    is kept as one narrow numpy array and rows are found through hash indexes by username and by user ID (if the
+    file has a user_id column), so a lookup is a dict access instead of a DataFrame scan and millions of rows stay
+    compact in memory. Lookups return UserMetadata records, or None for unknown users.
+    '''
+
+    def __init__(self, path=METADATA_PATH):
+        self.path = path
+        self.columns = {} # Map from record field to column array
+        self.names = []
+        self.user_ids = None
+        self.by_name = {} # Map from username to row
+        self.by_id = {} # Map from user ID to row
+
+    def load(self):
+        # Imported here so importing this module doesn't pull in pandas before the bot has started
+        import pandas as pd
+        df = pd.read_csv(self.path, dtype={"name": str})
+        self.columns = {field: df[column].to_numpy(dtype=dtype) for column, (field, dtype) in COLUMNS.items()}
+        self.names = df["name"].tolist()
+        self.by_name = {name: row for row, name in enumerate(self.names)}
+        if USER_ID_COLUMN in df.columns:
+            self.user_ids = df[USER_ID_COLUMN].to_numpy(dtype=np.int64)
+            self.by_id = {int(user_id): row for row, user_id in enumerate(self.user_ids)}
+        return self
+
+    def record(self, row):
+        return UserMetadata(
+            name=self.names[row],
+            user_id=int(self.user_ids[row]) if self.user_ids is not None else None,
+            **{field: column[row].item() for field, column in self.columns.items()},
+        )
+
+    def get(self, name=None, user_id=None):
+        '''Look a user up by Discord user ID, falling back to their username.'''
+        row = self.by_id.get(user_id) if user_id is not None else None
+        if row is None:
+            row = self.by_name.get(name)
+        return self.record(row) if row is not None else None
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,40 @@
+# Mod channel command that replies with the current metrics
+STATS_KEYWORD = "stats"
+
+
+class Metrics:
+    '''
+    Process-wide counters, gauges and timings for the bot's pipelines. Say `stats` in the mod channel to see them.
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {} # Map from name to [count, total seconds, max seconds]
+
+    def incr(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+    def rate(self, hits, misses):
+        '''Fraction of hits + misses that were hits, for two counters.'''
+        total = self.counters.get(hits, 0) + self.counters.get(misses, 0)
+        return self.counters.get(hits, 0) / total if total else 0.0
+
+    def format(self):
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        lines += [f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}" for name, value in sorted(self.gauges.items())]
+        lines += [f"{name}: avg {total / count * 1000:.1f}ms, max {max_seconds * 1000:.1f}ms over {count}"
+                  for name, (count, total, max_seconds) in sorted(self.timings.items())]
+        return "\n".join(lines) if lines else "No metrics recorded yet."
+
+
+metrics = Metrics()
@@ -0,0 +1,153 @@
+import asyncio
+import re
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from metrics import metrics
+
+# MinHash signature length, split into LSH bands of rows each (NUM_HASHES = BANDS * ROWS)
+NUM_HASHES = 64
+BANDS = 16
+ROWS = 4
+# Character shingle length
+SHINGLE_SIZE = 5
+# Estimated Jaccard similarity a message needs to join a cluster. Kept high since a few changed words ("bring you
+# flowers" vs "hurt you badly") can flip a message's meaning while most of its shingles still match
+SIMILARITY_THRESHOLD = 0.85
+# Most clusters kept, and how long a cluster lives after its last message (seconds)
+MAX_CLUSTERS = 20000
+CLUSTER_TTL = 24 * 60 * 60
+# Mersenne prime for the universal hash family, small enough that a * h fits in 64 bits for 32-bit shingle hashes
+PRIME = (1 << 31) - 1
+
+_rng = np.random.default_rng(152)
+_A = _rng.integers(1, PRIME, NUM_HASHES, dtype=np.uint64)
+_B = _rng.integers(0, PRIME, NUM_HASHES, dtype=np.uint64)
+
+
+def normalize_for_shingles(text):
+    # Campaigns vary links and spacing between copies, so those are folded away. Numbers are kept: ages and amounts
+    # change what a message means
+    text = re.sub(r'https?://\S+|www\.\S+', ' url ', text.lower())
+    return " ".join(re.sub(r'\W+', ' ', text).split())
+
+
+def minhash(text):
+    '''MinHash signature of the character shingles of normalized text at least SHINGLE_SIZE long.'''
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (a * h + b) mod p for every hash function and shingle at once
+    return ((_A * hashes[:, None] + _B) % np.uint64(PRIME)).min(axis=0)
+
+
+class Cluster:
+    '''
+    Messages that are near-duplicates of each other, e.g. copies of one spam campaign. A cluster is pending until its
+    first message has been classified; copies that arrive meanwhile wait for that verdict.
+    '''
+
+    def __init__(self, ID, signature):
+        self.ID = ID
+        self.signature = signature # MinHash signature of the first message
+        self.verdict = asyncio.get_running_loop().create_future() # Classification every message in the cluster shares
+        self.report_id = None # Open report aggregating the cluster, if its verdict is concerning
+        self.size = 1
+        self.users = set()
+        self.last_seen = time.time()
+
+    async def wait(self):
+        '''The cluster's verdict once its first message is classified, or None if that verdict isn't shared.'''
+        # Shielded so a cancelled waiter doesn't cancel the verdict for every other copy
+        return await asyncio.shield(self.verdict)
+
+
+class NearDuplicateIndex:
+    '''
+    Streaming near-duplicate detection with MinHash and locality-sensitive hashing. A message that matches no cluster
+    starts a pending one; later messages whose estimated similarity to a cluster is above threshold join it and reuse
+    its verdict instead of being classified again, waiting for it if the first message is still being classified.
+    Clusters expire ttl seconds after their last message and the least recently used are evicted past max_clusters.
+    '''
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_clusters=MAX_CLUSTERS, ttl=CLUSTER_TTL):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.ttl = ttl
+        self.clusters = OrderedDict() # Map from cluster ID to cluster, least recently used first
+        self.buckets = {} # Map from (band, band hash) to the IDs of clusters in that bucket
+        self.next_id = 0
+
+    def band_keys(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def lookup(self, text):
+        '''
+        Return (cluster, is_new): the cluster the message joins, or a new pending cluster it starts. Whoever starts a
+        cluster must settle() it once the message is classified, or copies waiting on it never finish.
+
+        Messages shorter than one shingle once normalized (emoji, punctuation, "ok") return (None, False): they'd all
+        share one signature, so they are always classified on their own.
+        '''
+        text = normalize_for_shingles(text)
+        if len(text) < SHINGLE_SIZE:
+            metrics.incr("near_duplicates.too_short")
+            return None, False
+        signature = minhash(text)
+        self.expire()
+        candidates = set()
+        for key in self.band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for ID in candidates:
+            similarity = np.mean(self.clusters[ID].signature == signature)
+            if similarity >= best_similarity:
+                best, best_similarity = self.clusters[ID], similarity
+        if best is None:
+            metrics.incr("near_duplicates.misses")
+            return self.add(signature), True
+        best.size += 1
+        best.last_seen = time.time()
+        self.clusters.move_to_end(best.ID)
+        metrics.incr("near_duplicates.hits")
+        return best, False
+
+    def settle(self, cluster, verdict):
+        '''Share verdict with the cluster's copies, or drop the cluster if verdict is None.'''
+        if verdict is None:
+            if cluster.ID in self.clusters:
+                self.remove(cluster.ID)
+            metrics.set("near_duplicates.clusters", len(self.clusters))
+        elif not cluster.verdict.done():
+            cluster.verdict.set_result(verdict)
+
+    def add(self, signature):
+        cluster = Cluster(self.next_id, signature)
+        self.next_id += 1
+        self.clusters[cluster.ID] = cluster
+        for key in self.band_keys(signature):
+            self.buckets.setdefault(key, set()).add(cluster.ID)
+        if len(self.clusters) > self.max_clusters:
+            self.remove(next(iter(self.clusters)))
+        metrics.set("near_duplicates.clusters", len(self.clusters))
+        return cluster
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        while self.clusters:
+            oldest = next(iter(self.clusters.values()))
+            if oldest.last_seen >= cutoff:
+                break
+            self.remove(oldest.ID)
+
+    def remove(self, ID):
+        cluster = self.clusters.pop(ID)
+        # Copies still waiting on a dropped cluster classify themselves
+        if not cluster.verdict.done():
+            cluster.verdict.set_result(None)
+        for key in self.band_keys(cluster.signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(ID)
+                if not bucket:
+                    del self.buckets[key]
@@ -0,0 +1,62 @@
+import re
+from metrics import metrics
+
+# Longest message Discord accepts
+DISCORD_MESSAGE_LIMIT = 2000
+# Where long text may be split, most preferred first: between reports (blank lines), then between lines
+SPLIT_BOUNDARIES = ("\n\n", "\n")
+
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT, boundaries=SPLIT_BOUNDARIES):
+    '''Split text into chunks of at most limit characters, at the most preferred boundary that makes them fit.'''
+    if len(text) <= limit:
+        return [text]
+    if not boundaries:
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    units = [unit for unit in re.split(f"(?<={boundaries[0]})", text) if unit]
+    chunks = []
+    current = ""
+    for unit in units:
+        if len(current) + len(unit) <= limit:
+            current += unit
+            continue
+        if current:
+            chunks.append(current)
+        current = ""
+        if len(unit) > limit:
+            chunks.extend(split_message(unit, limit, boundaries[1:]))
+        else:
+            current = unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def coalesce(responses, limit=DISCORD_MESSAGE_LIMIT):
+    '''
+    Merge a list of reply strings into as few messages as fit within limit, in order. Strings that don't already end
+    in a newline are put on their own line, and any string too long on its own is split with split_message().
+    '''
+    messages = []
+    current = ""
+    for response in responses:
+        for piece in split_message(response, limit):
+            joined = current + ("" if not current or current.endswith("\n") else "\n") + piece
+            if len(joined) <= limit:
+                current = joined
+                continue
+            messages.append(current)
+            current = piece
+    if current:
+        messages.append(current)
+    # Discord rejects empty and whitespace-only messages
+    return [message for message in messages if message.strip()]
+
+
+async def send_all(channel, responses):
+    '''Send a list of replies to channel in as few messages as possible.'''
+    messages = coalesce(responses)
+    metrics.incr("outbound.responses", len(responses))
+    metrics.incr("outbound.messages_sent", len(messages))
+    for message in messages:
+        await channel.send(message)
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Longest a write may wait before it is flushed (seconds)
+FLUSH_DELAY = 0.5
+# Flush immediately once this many writes are pending
+MAX_BATCH = 100
+
+
+class PersistenceWorker:
+    '''
+    Runs disk writes off the asyncio event loop. Writes submitted within FLUSH_DELAY of each other are coalesced into a
+    single flush on one background thread, so they stay in submission order and the gateway loop never blocks on disk.
+    Callers that must know their writes hit disk (e.g. before telling a user they were banned) await durable(), which
+    raises a failed write's error once, to the first caller after it.
+    '''
+
+    def __init__(self, flush_delay=FLUSH_DELAY, max_batch=MAX_BATCH, on_flush=None):
+        self.flush_delay = flush_delay
+        self.max_batch = max_batch
+        self.on_flush = on_flush # Called once after each batch of writes, e.g. to commit a transaction
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self.pending = []
+        self.timer = None
+        self.last_flush = None # Flush still in progress, if any
+        self.error = None # Error of a failed flush not yet raised by durable()
+        self.failed_seq = None # Sequence number of the first write that failed
+        self.submitted_seq = 0 # Sequence number of the latest submitted write
+        self.written_seq = 0 # Sequence number of the latest write known to be on disk, along with every one before it
+
+    def submit(self, fn, *args):
+        '''Queue a write and return its sequence number (see written_seq).'''
+        self.submitted_seq += 1
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop yet (startup or offline scripts), write synchronously
+            self._write([(self.submitted_seq, fn, args)])
+            return self.submitted_seq
+        self.pending.append((self.submitted_seq, fn, args))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.flush_delay, self.flush)
+        return self.submitted_seq
+
+    def flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self.last_flush = asyncio.get_running_loop().run_in_executor(self.executor, self._write, batch)
+            self.last_flush.add_done_callback(self._flushed)
+        return self.last_flush
+
+    async def durable(self):
+        '''Wait until every write submitted so far is on disk, raising the error of any flush that failed since the last call.'''
+        future = self.flush()
+        if future:
+            # The executor has a single thread, so the latest flush finishing means all earlier ones have too
+            await asyncio.wait([future])
+        error, self.error = self.error, None
+        if error:
+            raise error
+
+    def _write(self, batch):
+        error = None
+        for seq, fn, args in batch:
+            try:
+                fn(*args)
+            except Exception as e:
+                error = error or e
+                if self.failed_seq is None:
+                    self.failed_seq = seq
+        if self.on_flush:
+            self.on_flush()
+        # Never past a failed write, so whatever it touched isn't treated as safely on disk (see ReportIndex._evict)
+        self.written_seq = batch[-1][0] if self.failed_seq is None else self.failed_seq - 1
+        if error:
+            raise error
+
+    def _flushed(self, future):
+        if self.last_flush is future:
+            self.last_flush = None
+        if not future.cancelled() and future.exception():
+            print(f"Failed to persist writes: {future.exception()}")
+            self.error = future.exception()
@@ -0,0 +1,98 @@
+import csv
+import re
+from collections import deque
+from metrics import metrics
+
+PLATFORM_CATEGORY = "trying to move someone onto a different platform"
+PLATFORM_CSV = "datasets/platform.csv"
+# Phrases that ask someone to move the conversation, on top of the ones learned from the dataset
+BASE_CUES = [
+    "add me", "dm me", "message me", "text me", "call me", "hit me up", "find me on", "reach me on", "my number",
+    "my handle", "my username", "my snap", "my insta", "my ig", "my email", "email me", "switch to", "move to",
+    "talk on", "chat on", "let's take this to",
+]
+# Platform names and nicknames that aren't spelled out in the dataset
+BASE_PLATFORMS = ["whatsapp", "snapchat", "snap", "instagram", "insta", "ig", "telegram", "kik", "discord", "imessage"]
+PHONE_RE = re.compile(r'(?<!\d)(?:\+?\d{1,3}[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)')
+URL_RE = re.compile(r'https?://\S+|www\.\S+|\b[\w-]+\.(?:com|net|org|me|io|gg|ly)(?:/\S*)?\b', re.IGNORECASE)
+HANDLE_RE = re.compile(r'(?<![\w.])@[A-Za-z0-9_.]{2,}')
+
+
+class AhoCorasick:
+    '''
+    Multi-pattern string matcher: finds every occurrence of any pattern in one linear pass over the text.
+    Matches must start and end on word boundaries.
+    '''
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append(pattern)
+        # Breadth-first pass to link each node to the longest proper suffix that is also in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        found = set()
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for pattern in self.output[node]:
+                start = i - len(pattern) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (i + 1 == len(text) or not text[i + 1].isalnum()):
+                    found.add(pattern)
+        return found
+
+
+class PlatformMatcher:
+    '''
+    Fast path for spotting attempts to move a conversation off the platform. Platform names and solicitation phrases
+    are learned from datasets/platform.csv and matched with one Aho-Corasick automaton; phone numbers, URLs and
+    @handles are matched by shape. A message is a confident match when a solicitation phrase appears together with
+    a platform name or contact details; contact details alone are common in spam and are left to the classifier.
+    '''
+
+    def __init__(self, csv_file_path=PLATFORM_CSV):
+        platforms, cues = set(BASE_PLATFORMS), set(BASE_CUES)
+        with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+            for row in csv.DictReader(csv_file):
+                # e.g. "Add me on Facebook Messenger for private chat." -> cue "add me on", platform "facebook messenger"
+                m = re.match(r"(.*?\b(?:on|to|my|use))\s+((?:[A-Z][\w.]*)(?:\s+[A-Z][\w.]*)*)", row["message"])
+                if m:
+                    cues.add(m.group(1).lower())
+                    # The capture takes a sentence's closing period along ("Band." -> "band"), inner dots are kept ("rocket.chat")
+                    platforms.add(m.group(2).lower().rstrip("."))
+        self.platforms = platforms
+        self.cues = cues
+        self.automaton = AhoCorasick(platforms | cues)
+
+    def match(self, message):
+        '''Return (is_confident_match, matched terms).'''
+        text = message.lower()
+        found = self.automaton.find(text)
+        contacts = PHONE_RE.findall(message) + URL_RE.findall(message) + HANDLE_RE.findall(message)
+        has_cue = bool(found & self.cues)
+        has_platform = bool(found & self.platforms)
+        confident = has_cue and (has_platform or bool(contacts))
+        metrics.incr("platform_matcher.matched" if confident else "platform_matcher.missed")
+        return confident, sorted(found) + contacts
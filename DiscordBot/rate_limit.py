@@ -0,0 +1,114 @@
+import asyncio
+import random
+import time
+from classifier_backends import ClassifierBackend
+from metrics import metrics
+
+# Client-side quota for the classifier backend
+REQUESTS_PER_MINUTE = 300
+TOKENS_PER_MINUTE = 300000
+# Retries for quota and transient errors, with full-jitter exponential backoff (seconds)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# Errors worth retrying: quota exhaustion and transient server or network failures
+RETRYABLE_ERRORS = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "Aborted",
+}
+
+
+def estimate_tokens(prompt):
+    # Roughly four characters per token, plus a few for the category name in the response
+    return len(prompt) // 4 + 16
+
+
+def is_retryable(error):
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    '''
+    Allows up to rate_per_minute units per minute, refilled continuously, with bursts of up to a minute's worth.
+    '''
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def take(self, amount):
+        '''Take amount units if available and return 0, otherwise return how long to wait before trying again.'''
+        amount = min(amount, self.capacity)
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    async def acquire(self, amount=1):
+        while (wait := self.take(amount)) > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, amount=1):
+        while (wait := self.take(amount)) > 0:
+            time.sleep(wait)
+
+
+class RateLimitedBackend(ClassifierBackend):
+    '''
+    Wraps a classifier backend with request and token per-minute limits, so throughput sits at the quota ceiling
+    instead of bouncing off it. Quota and transient errors are retried with jittered exponential backoff; safety
+    blocks (ValueError) are passed straight through. Time spent waiting for quota is recorded in the metrics.
+    '''
+
+    def __init__(self, backend, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_retries=MAX_RETRIES):
+        self.backend = backend
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+
+    def backoff(self, attempt, error):
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        metrics.incr("classifier.retries")
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def generate_async(self, prompt):
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate_tokens(prompt))
+            metrics.observe("classifier.queue_wait", time.monotonic() - start)
+            try:
+                return await self.backend.generate_async(prompt)
+            except ValueError:
+                raise
+            except Exception as e:
+                await asyncio.sleep(self.backoff(attempt, e))
+            attempt += 1
+
+    def generate(self, prompt):
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            self.requests.acquire_sync()
+            self.tokens.acquire_sync(estimate_tokens(prompt))
+            metrics.observe("classifier.queue_wait", time.monotonic() - start)
+            try:
+                return self.backend.generate(prompt)
+            except ValueError:
+                raise
+            except Exception as e:
+                time.sleep(self.backoff(attempt, e))
+            attempt += 1
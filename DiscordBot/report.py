@@ -1,9 +1,6 @@
 from enum import Enum, auto
 import discord
 import re
-import pandas as pd
-
-metadata = pd.read_csv("datasets/metadata.csv")
 
 class State(Enum):
     REPORT_START = auto()
@@ -126,10 +123,8 @@ class Report:
             # Here we've found the message - it's up to you to decide what to do next!
             self.state = State.MESSAGE_IDENTIFIED
             
-            name = reported_message.author.name
-            if name in metadata["name"].values:
-                row = metadata[metadata["name"] == name]
-                suspicion_score = row["probability_scammer"].values[0]
+            suspicion_score = self.client.scammer_scorer.score(reported_message.author)
+            if suspicion_score is not None:
                 self.details["Suspicion score"] = suspicion_score
         
             # Record message details
@@ -0,0 +1,64 @@
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+ARCHIVE_DIR = "report_archive"
+SUMMARY_FILE = "summary.json"
+
+
+class ReportArchive:
+    '''
+    Cold tier for closed reports. Reports are appended to gzip-compressed JSON-lines partitions, one per month of
+    closing, and are never rewritten. A small summary of archived report counts per reported user is kept in memory
+    so history checks don't need to open the archive.
+    '''
+
+    def __init__(self, path=ARCHIVE_DIR):
+        self.path = path
+        self.user_counts = {} # Map from reported user to their number of archived reports
+
+    def load(self):
+        os.makedirs(self.path, exist_ok=True)
+        summary_path = os.path.join(self.path, SUMMARY_FILE)
+        if os.path.isfile(summary_path):
+            with open(summary_path, "r") as json_file:
+                self.user_counts = json.load(json_file)
+        else:
+            # Rebuild the summary from the partitions
+            self.user_counts = {}
+            for report in self.iter_reports():
+                self.record(report)
+
+    def partitions(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith(".jsonl.gz"))
+
+    def iter_reports(self):
+        for partition in self.partitions():
+            with gzip.open(os.path.join(self.path, partition), "rt") as archive_file:
+                for line in archive_file:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def record(self, report):
+        '''Count a report as archived. Called on the event loop so counts are current before the write lands.'''
+        user = report["Reported user"]
+        self.user_counts[user] = self.user_counts.get(user, 0) + 1
+
+    def write(self, report, user_counts):
+        '''Append a report to the current month's partition and save the summary. Runs on the persistence worker.'''
+        partition = datetime.now(timezone.utc).strftime("%Y-%m") + ".jsonl.gz"
+        # Appending in gzip mode adds a new member, which readers see as one continuous stream
+        with gzip.open(os.path.join(self.path, partition), "at") as archive_file:
+            archive_file.write(json.dumps(report) + "\n")
+        summary_path = os.path.join(self.path, SUMMARY_FILE)
+        with open(summary_path + ".tmp", "w") as json_file:
+            json.dump(user_counts, json_file)
+        os.replace(summary_path + ".tmp", summary_path)
+
+    def count(self, reported_user):
+        return self.user_counts.get(reported_user, 0)
+
+    def get_user_reports(self, reported_user):
+        '''Archived reports for a user. Scans the cold partitions, so keep it off hot paths.'''
+        return [report for report in self.iter_reports() if report["Reported user"] == reported_user]
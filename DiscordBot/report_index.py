@@ -0,0 +1,181 @@
+import json
+import os
+from collections import OrderedDict
+from persistence import PersistenceWorker
+from report_archive import ReportArchive
+
+FALSE_REPORTS_PATH = "saved_false_reports.json"
+# Most reported users whose report bodies are kept in memory at once
+MAX_RESIDENT_USERS = 1000
+
+
+def write_json(path, data):
+    with open(path, "w") as json_file:
+        json.dump(data, json_file, indent=4)
+
+
+class ReportIndex:
+    '''
+    Authoritative in-process view of the saved report history, owned by the client and shared with every Report_Mod.
+    Every mutation updates the index and is then written to the report store by the persistence worker.
+
+    Only open reports are kept here and in the store. Closed reports move to the report archive, which keeps a
+    per-user count so report history checks still see them.
+
+    The index always holds a compact key for each open report (ID, reported user, Status and Priority bucket). Report
+    bodies are sharded by reported user and paged in from the store on demand; only the MAX_RESIDENT_USERS most
+    recently touched shards stay resident.
+    '''
+
+    def __init__(self, store, archive=None, max_resident_users=MAX_RESIDENT_USERS):
+        self.store = store
+        self.archive = archive or ReportArchive()
+        self.persistence = PersistenceWorker(on_flush=store.commit)
+        self.max_resident_users = max_resident_users
+        self.counter = 0
+        self.report_users = {} # Map from open report ID to its reported user
+        self.user_open_counts = {} # Map from reported user to their number of open reports
+        self.by_bucket = {} # Map from (Status, Priority) to the IDs in that bucket
+        self.shards = OrderedDict() # Map from reported user to {ID: report}, least recently used first
+        self.shard_write_seq = {} # Map from resident user to the sequence number of their latest write
+        self.false_reports = {} # Map from reporter name to their number of false reports
+        self.versions = {} # Map from open report ID to how many times it has been changed since loading
+
+    def load(self):
+        self.counter = self.store.load()
+        self.archive.load()
+        for ID, reported_user, status, priority in self.store.get_report_keys():
+            # Move reports closed before archiving existed out of the working set
+            if status == "Closed":
+                self._archive(self.store.get_report(ID))
+            else:
+                self._index(ID, reported_user, status, priority)
+        if os.path.isfile(FALSE_REPORTS_PATH):
+            with open(FALSE_REPORTS_PATH, "r") as json_file:
+                self.false_reports = json.load(json_file)
+        return self.counter
+
+    async def durable(self):
+        '''Wait until every mutation made so far has been written to disk.'''
+        await self.persistence.durable()
+
+    def _index(self, ID, reported_user, status, priority):
+        self.report_users[ID] = reported_user
+        self.user_open_counts[reported_user] = self.user_open_counts.get(reported_user, 0) + 1
+        self.by_bucket.setdefault((status, priority), set()).add(ID)
+
+    def _unindex(self, ID, reported_user, status, priority):
+        del self.report_users[ID]
+        self.user_open_counts[reported_user] -= 1
+        if not self.user_open_counts[reported_user]:
+            del self.user_open_counts[reported_user]
+        bucket = self.by_bucket[(status, priority)]
+        bucket.discard(ID)
+        if not bucket:
+            del self.by_bucket[(status, priority)]
+
+    def _keys(self, report):
+        return (report["ID"], report["Reported user"], report.get("Status"), report.get("Priority"))
+
+    def _shard(self, reported_user):
+        '''Reports of one user, paging them in from the store if they aren't resident.'''
+        if reported_user in self.shards:
+            self.shards.move_to_end(reported_user)
+            return self.shards[reported_user]
+        shard = {}
+        # Users without open reports have nothing in the store, no need to query it
+        if reported_user in self.user_open_counts:
+            shard = {report["ID"]: report for report in self.store.get_user_reports(reported_user)}
+        self.shards[reported_user] = shard
+        self._evict(keep=reported_user)
+        return shard
+
+    def _evict(self, keep):
+        # Shards with writes still queued can't be dropped yet, paging them back in would read stale data. The shard
+        # being handed out (keep) stays too, the caller is about to read or write it.
+        for reported_user in list(self.shards):
+            if len(self.shards) <= self.max_resident_users:
+                break
+            if reported_user == keep:
+                continue
+            if self.shard_write_seq.get(reported_user, 0) <= self.persistence.written_seq:
+                del self.shards[reported_user]
+                self.shard_write_seq.pop(reported_user, None)
+
+    def _submit(self, reported_user, fn, *args):
+        self.shard_write_seq[reported_user] = self.persistence.submit(fn, *args)
+
+    def add_report(self, report_details, counter):
+        reported_user = report_details["Reported user"]
+        self._shard(reported_user)[report_details["ID"]] = report_details
+        self._index(*self._keys(report_details))
+        self.counter = max(self.counter, counter)
+        # Hand the worker a copy so later in-memory edits can't race with serialization
+        self._submit(reported_user, self.store.add_report, dict(report_details), counter)
+
+    def set_report_val(self, ID, key, value):
+        report = self.get_report(ID)
+        if not report:
+            return
+        # Re-bucket the report in case its Status or Priority changed
+        self._unindex(*self._keys(report))
+        report[key] = value
+        self.versions[report["ID"]] = self.versions.get(report["ID"], 0) + 1
+        if report["Status"] == "Closed":
+            del self.shards[report["Reported user"]][report["ID"]]
+            del self.versions[report["ID"]]
+            self._archive(report)
+            return
+        self._index(*self._keys(report))
+        self._submit(report["Reported user"], self.store.set_report_val, ID, key, value)
+
+    def _archive(self, report):
+        self.archive.record(report)
+        self.persistence.submit(self.archive.write, dict(report), dict(self.archive.user_counts))
+        self._submit(report["Reported user"], self.store.remove_report, report["ID"])
+
+    def remove_report(self, ID):
+        report = self.get_report(ID)
+        if not report:
+            return
+        self.versions.pop(report["ID"], None)
+        self._unindex(*self._keys(report))
+        del self.shards[report["Reported user"]][report["ID"]]
+        self._submit(report["Reported user"], self.store.remove_report, ID)
+
+    def version(self, ID):
+        '''Changes with every update to the report, for caching things derived from it.'''
+        return self.versions.get(int(ID), 0)
+
+    def get_report(self, ID):
+        reported_user = self.report_users.get(int(ID))
+        if reported_user is None:
+            return None
+        return self._shard(reported_user).get(int(ID))
+
+    def get_user_reports(self, reported_user):
+        '''Open reports against a user.'''
+        if reported_user not in self.user_open_counts:
+            return []
+        return list(self._shard(reported_user).values())
+
+    def get_user_report_count(self, reported_user):
+        '''Number of reports ever filed against a user, open or archived.'''
+        return self.user_open_counts.get(reported_user, 0) + self.archive.count(reported_user)
+
+    def get_open_report_keys(self, prioritized):
+        '''
+        (ID, Priority) of the open reports ordered by ID, either those with a priority set or those still at "NULL".
+        Answered from the index alone, report bodies are left for get_report to page in.
+        '''
+        keys = []
+        for (status, priority), bucket in self.by_bucket.items():
+            if status == "Open" and (priority != "NULL") == prioritized:
+                keys.extend((ID, priority) for ID in bucket)
+        return sorted(keys)
+
+    def add_false_report(self, reporter):
+        '''Record a false report by reporter and return their total number of false reports.'''
+        self.false_reports[reporter] = self.false_reports.get(reporter, 0) + 1
+        self.persistence.submit(write_json, FALSE_REPORTS_PATH, dict(self.false_reports))
+        return self.false_reports[reporter]
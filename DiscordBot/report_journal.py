@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+
+SNAPSHOT_PATH = "saved_report_history.json"
+JOURNAL_PATH = "saved_report_history.journal"
+# Number of journal records to accumulate before compacting into the snapshot
+COMPACT_EVERY = 500
+
+
+def apply_record(data, record):
+    '''
+    Apply a single journal record to report history data of the form {"counter": int, "user_reports": {user: [report]}}.
+    Records are idempotent so a journal can safely be replayed on top of a snapshot that already contains some of it.
+    '''
+    op = record["op"]
+    if op == "add":
+        report = record["report"]
+        reports = data["user_reports"].setdefault(report["Reported user"], [])
+        if not any(r["ID"] == report["ID"] for r in reports):
+            reports.append(report)
+        data["counter"] = max(data["counter"], record["counter"])
+    elif op == "set":
+        for reports in data["user_reports"].values():
+            for report in reports:
+                if report["ID"] == record["ID"]:
+                    report[record["key"]] = record["value"]
+    elif op == "remove":
+        for user, reports in list(data["user_reports"].items()):
+            data["user_reports"][user] = [r for r in reports if r["ID"] != record["ID"]]
+            # Remove user entry if no more reports left
+            if not data["user_reports"][user]:
+                del data["user_reports"][user]
+
+
+def replay(snapshot_path, journal_paths):
+    '''
+    Rebuild report history data from a snapshot followed by any number of journal files.
+    '''
+    data = {"counter": 0, "user_reports": {}}
+    if os.path.isfile(snapshot_path):
+        with open(snapshot_path, "r") as json_file:
+            data = json.load(json_file)
+    for path in journal_paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path, "r") as journal_file:
+            for line in journal_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write, nothing after it was committed
+                    break
+                apply_record(data, record)
+    return data
+
+
+class ReportJournal:
+    '''
+    Append-only journal for the saved report history. Every new report or mutation is written as one JSON line, so
+    saving costs O(1) instead of rewriting the whole history. Once enough records accumulate the journal is rotated
+    and folded into the snapshot by a background thread.
+    '''
+
+    def __init__(self, snapshot_path=SNAPSHOT_PATH, journal_path=JOURNAL_PATH, compact_every=COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compacting_path = journal_path + ".compacting"
+        self.compact_every = compact_every
+        self.data = {"counter": 0, "user_reports": {}}
+        self.records_since_compact = 0
+        self.compaction_thread = None
+
+    def load(self):
+        # Replay snapshot plus journal tail (including a rotated journal left behind by an interrupted compaction)
+        self.data = replay(self.snapshot_path, [self.compacting_path, self.journal_path])
+        if not os.path.isfile(self.snapshot_path):
+            with open(self.snapshot_path, "w") as json_file:
+                json.dump({"counter": 0, "user_reports": {}}, json_file)
+        self.records_since_compact = 0
+        if os.path.isfile(self.compacting_path):
+            self.compact()
+        return self.data
+
+    def append(self, record):
+        apply_record(self.data, record)
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.write(json.dumps(record) + "\n")
+        self.records_since_compact += 1
+        if self.records_since_compact >= self.compact_every:
+            self.compact()
+
+    def add_report(self, report_details, counter):
+        self.append({"op": "add", "counter": counter, "report": report_details})
+
+    def set_report_val(self, ID, key, value):
+        self.append({"op": "set", "ID": int(ID), "key": key, "value": value})
+
+    def remove_report(self, ID):
+        self.append({"op": "remove", "ID": int(ID)})
+
+    def compact(self):
+        '''
+        Rotate the live journal and fold it into the snapshot in the background. Only the rename happens on the
+        caller's thread; the snapshot is rebuilt from files so it never touches the live in-memory data.
+        '''
+        if self.compaction_thread and self.compaction_thread.is_alive():
+            return
+        # A rotated journal left over from an interrupted compaction is finished before rotating again
+        if not os.path.isfile(self.compacting_path):
+            if not os.path.isfile(self.journal_path):
+                return
+            os.replace(self.journal_path, self.compacting_path)
+            self.records_since_compact = 0
+        self.compaction_thread = threading.Thread(target=self._compact, daemon=True)
+        self.compaction_thread.start()
+
+    def _compact(self):
+        data = replay(self.snapshot_path, [self.compacting_path])
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(data, json_file, indent=4)
+        os.replace(tmp_path, self.snapshot_path)
+        os.remove(self.compacting_path)
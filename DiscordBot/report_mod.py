@@ -1,8 +1,10 @@
 from enum import Enum, auto
 import discord
 import re
-import json
-import os
+from report_pages import ReportPager
+
+# Reply when a ban can't be recorded on disk, in which case the banned user isn't told
+SAVE_FAILED_MESSAGE = "The report was closed but couldn't be saved, so the user has not been notified of the ban. Please check the bot's logs."
 
 class State(Enum):
     REPORT_START = auto()
@@ -43,8 +45,7 @@ class Report_Mod:
         self.current_report = None
         self.open_unprioritzed_reports = []
         self.report_to_set_priority_id = None
-        self.reports_to_prioritize = None
-        self.open_reports_sorted_str = None
+        self.pager = None # Page through the report queue being evaluated or prioritized
         self.actions = {
             "1": {
                 "Action": "Escalate report",
@@ -106,17 +107,13 @@ class Report_Mod:
 
         if self.state == State.PRIORITY:
             # Check if there are any unpriotized reports
-            json_data = self.get_report_history_data()
-            if not json_data:
-                return ["No open reports found."]
-
-            open_unprioritzed_reports = [report for user, reports in json_data["user_reports"].items() for report in reports if report["Status"] == "Open" and report["Priority"] == "NULL"]
-            open_prioritzed_reports = [report for user, reports in json_data["user_reports"].items() for report in reports if report["Status"] == "Open" and report["Priority"] != "NULL"]
+            open_unprioritzed_reports = self.client.report_index.get_open_report_keys(prioritized=False)
+            open_prioritzed_reports = self.client.report_index.get_open_report_keys(prioritized=True)
             if len(open_unprioritzed_reports) == 0:
                 self.state = State.REPORT_COMPLETE
                 reply = "No unprioritized reports found."
                 if len(open_prioritzed_reports) > 0:
-                    reply += f"There are {open_prioritzed_reports} reports that have been prioritized and need evaluation."
+                    reply += f"There are {len(open_prioritzed_reports)} reports that have been prioritized and need evaluation."
                     reply += "Please start the evaluation process."
                 return [
                     reply
@@ -126,33 +123,32 @@ class Report_Mod:
 
                 ### SORT BY ID
                 self.open_unprioritzed_reports = open_unprioritzed_reports
-                self.reports_to_prioritize = "\n\n".join([
-                    f"__**ID: {report['ID']} - Reason: {report['Reported Reason']}**__\n" + 
-                    "\n".join([f"{key}: {value}" for key, value in report.items() if key != 'ID' and key != 'Reported Reason'])
-                    for report in open_unprioritzed_reports
-                ])
+                self.pager = ReportPager([ID for ID, _ in open_unprioritzed_reports], self.client.report_index.get_report,
+                                         self.client.report_fragments, "Reported Reason", "Reason")
 
                 self.state = State.REPORT_TO_PRIORITIZE
                 reply =  "Thank you for starting the prioritization process. "
                 reply += "Say `help` at any time for more information.\n\n"
                 reply += "Here is a list of the current open unprioritized reports sorted by time submitted.\n"
-                reply += self.reports_to_prioritize
+                reply += self.pager.render()
                 reply += "\n\nPlease provide the ID number of the report you wish to process:"
                 return [reply]
 
 
         if self.state == State.REPORT_TO_PRIORITIZE:
             m = message.content.strip()
-            report_to_set = None
-            for report in self.open_unprioritzed_reports:
-                if str(report["ID"]) == m:
-                    report_to_set = report
+            if self.pager.turn(m):
+                return [
+                    self.pager.render(),
+                    "\n\nPlease provide the ID number of the report you wish to process:"
+                ]
+            report_to_set = self.pager.get(m)
             if not report_to_set:
                 return [
                     "Invalid selection. Going back a step...",
                     "Say `cancel` to cancel\n",
                     "Here is a list of the current open unprioritized reports sorted by time submitted.\n",
-                    self.reports_to_prioritize,
+                    self.pager.render(),
                     "\n\nPlease provide the ID number of the report you wish to process:"
                 ]
             # Get report to set priority
@@ -210,13 +206,9 @@ class Report_Mod:
 
 
         if self.state == State.EVAL:
-            # Compile a list of open reports from JSON data with sorted priorities
-            json_data = self.get_report_history_data()
-            if not json_data:
-                return ["No open reports found."]
-            
-            open_reports = [report for user, reports in json_data["user_reports"].items() for report in reports if report["Status"] == "Open" and report["Priority"] != "NULL"]
-            open_unprioritzed_reports = [report for user, reports in json_data["user_reports"].items() for report in reports if report["Status"] == "Open" and report["Priority"] == "NULL"]
+            # Compile a list of open reports from the report store with sorted priorities
+            open_reports = self.client.report_index.get_open_report_keys(prioritized=True)
+            open_unprioritzed_reports = self.client.report_index.get_open_report_keys(prioritized=False)
             if len(open_reports) == 0:
                 self.state = State.REPORT_COMPLETE
                 reply = "No open reports found."
@@ -227,36 +219,34 @@ class Report_Mod:
                 ]
 
             priority_order = {"High": 1, "Medium": 2, "Low": 3}
-            open_reports_sorted = sorted(open_reports, key=lambda x: (priority_order.get(x["Priority"], 4), x["ID"]))
-            self.sorted_reports = open_reports_sorted
-            self.open_reports_sorted_str = "\n\n".join([
-                f"__**ID: {report['ID']} - Priority: {report['Priority']}**__\n" + 
-                "\n".join([f"{key}: {value}" for key, value in report.items() if key != 'ID' and key != 'Priority'])
-                for report in open_reports_sorted
-            ])
+            open_reports_sorted = sorted(open_reports, key=lambda x: (priority_order.get(x[1], 4), x[0]))
+            self.sorted_reports = [ID for ID, _ in open_reports_sorted]
+            self.pager = ReportPager(self.sorted_reports, self.client.report_index.get_report,
+                                     self.client.report_fragments, "Priority", "Priority")
 
             self.state = State.REPORT_SELECTED
             reply =  "Thank you for starting the evaluation process. "
             reply += "Say `help` at any time for more information.\n\n"
             reply += "Here is a list of the current open reports sorted by priority.\n"
-            reply += self.open_reports_sorted_str
+            reply += self.pager.render()
             reply += "\n\nPlease provide the ID number of the report you wish to process:"
             return [reply]
         
         if self.state == State.REPORT_SELECTED:
             m = message.content.strip()
-            current_report = None
+            if self.pager.turn(m):
+                return [
+                    self.pager.render(),
+                    "\n\nPlease provide the ID number of the report you wish to process:"
+                ]
             # Get report
-            for report in self.sorted_reports:
-                print(report["ID"], m)
-                if str(report["ID"]) == m:
-                    current_report = report
+            current_report = self.pager.get(m)
             if not current_report:
                 return [
                     "Invalid selection. Going back a step...",
                     "Say `cancel` to cancel\n",
                     "Here is a list of the current open reports sorted by priority.\n",
-                    self.open_reports_sorted_str,
+                    self.pager.render(),
                     "\n\nPlease provide the ID number of the report you wish to process:"
                 ]
             self.current_report = current_report
@@ -281,6 +271,10 @@ class Report_Mod:
 
             if self.state == State.BAN:
                 reason = self.current_report["Reported Reason"]
+                # Make sure the closed report is on disk before telling the user they are banned
+                if not await self.close_report_durably():
+                    self.state = State.REPORT_COMPLETE
+                    return [SAVE_FAILED_MESSAGE]
                 await self.notify_reported_user(self.current_report["Reported user ID"], self.actions[m]["Message"].format(reason))
                 self.state = State.REPORT_COMPLETE
                 return [
@@ -310,22 +304,18 @@ class Report_Mod:
                 # SEND MESSAGE TO USER:
                 await self.notify_reported_user(self.current_report["Reported user ID"], self.actions[m]["Message"].format(reason))
 
-                # Get number of reports on user
-                json_data = self.get_report_history_data()
-                if not json_data:
-                    return ["No open reports found."]
-
-                reports = json_data["user_reports"][reported_user]
+                # Get number of reports on user (including closed reports in the archive)
+                num_reports = self.client.report_index.get_user_report_count(reported_user)
 
 
                 if self.state == State.REMOVE_CONTENT:
                     # NEED TO REMOVE THE MESSAGE
                     await self.delete_message(self.current_report["Channel ID"], self.current_report["Message ID"])
 
-                if len(reports) >= 3:
+                if num_reports >= 3:
                     self.state = State.BAN_OR_SUSPEND
                     return [
-                        f"User has a total of {len(reports)} reports filed against them.\n",
+                        f"User has a total of {num_reports} reports filed against them.\n",
                         "Please choose to either:\n",
                         "1. Suspend offending user\n",
                         "2. Ban offending user"
@@ -355,25 +345,9 @@ class Report_Mod:
                 ]
             
             # NEED TO KEEP TRACK OF FALSE REPORTS BY USERS
-            if os.path.isfile("saved_false_reports.json"):
-                with open("saved_false_reports.json", "r") as json_file:
-                    json_data = json.load(json_file)
-            else:
-                with open("saved_false_reports.json", "w") as json_file:
-                    json.dump({}, json_file)
-                    json_data = {}
-            
-            if self.current_report["Reported by"] in json_data:
-                json_data[self.current_report["Reported by"]] += 1
-            else:
-                json_data[self.current_report["Reported by"]] = 1
-
-            with open("saved_false_reports.json", "w") as json_file:
-                json.dump(json_data, json_file, indent=4)
-
-
+            num_false_reports = self.client.report_index.add_false_report(self.current_report["Reported by"])
 
-            if json_data[self.current_report["Reported by"]] >= 3:
+            if num_false_reports >= 3:
                 # Suspend user
                 
                 # SEND MESSAGE TO USER: "You have been suspended for repeated false reporting."
@@ -425,6 +399,11 @@ class Report_Mod:
                 ]
 
             action = "suspended" if m == "1" else "banned"
+            if action == "banned":
+                # Make sure the closed report is on disk before telling the user they are banned
+                if not await self.close_report_durably():
+                    self.state = State.REPORT_COMPLETE
+                    return [SAVE_FAILED_MESSAGE]
             # SEND MESSAGE TO USER: f"Your account has been {action} as a result of {} content violations."
             reason = self.current_report["Reported Reason"]
             await self.notify_reported_user(self.current_report["Reported user ID"], f"Your account has been {action} as a result of {reason} content violations.")
@@ -436,22 +415,23 @@ class Report_Mod:
 
 
 
-    def get_report_history_data(self):
-        json_data = None
-        try:
-            with open("saved_report_history.json", "r") as file:
-                json_data = json.load(file)
-        except:
-            self.state = State.REPORT_COMPLETE
-        return json_data
-
-
     def close_report(self):
-        if not self.current_report:
+        if not self.current_report or self.current_report["Status"] == "Closed":
             return
         self.set_report_val(self.current_report["ID"], "Status", "Closed")
 
 
+    async def close_report_durably(self):
+        '''Close the current report and wait for it to reach disk. Return whether it did.'''
+        self.close_report()
+        try:
+            await self.client.report_index.durable()
+        except Exception as e:
+            print(f"Failed to save closed report {self.current_report['ID']}: {e!r}")
+            return False
+        return True
+
+
     def report_complete(self):
         return self.state == State.REPORT_COMPLETE
 
@@ -461,15 +441,7 @@ class Report_Mod:
 
 
     def set_report_val(self, ID, key, value):
-        with open("saved_report_history.json", "r") as json_file:
-            json_data = json.load(json_file)
-        # Find report
-        for user, reports in (json_data["user_reports"]).items():
-            for report in reports:
-                if report["ID"] == int(ID):
-                    report[key] = value
-        with open("saved_report_history.json", "w") as json_file:
-            json.dump(json_data, json_file, indent=4)
+        self.client.report_index.set_report_val(ID, key, value)
 
 
     def print_message(self, on_error=False):
@@ -485,33 +457,13 @@ class Report_Mod:
 
 
     def remove_report(self):
-        # Remove report from JSON file (saved_report_history)
-        with open("saved_report_history.json", "r") as json_file:
-            json_data = json.load(json_file)
-        report_found = False
-        for user, reports in list(json_data["user_reports"].items()):
-            for report in reports:
-                if report["ID"] == self.current_report["ID"]:
-                    json_data["user_reports"][user].remove(report)
-                    report_found = True
-                    break
-            # Remove user entry if no more reports left
-            if not json_data["user_reports"][user]:
-                del json_data["user_reports"][user]
-            if report_found:
-                break
-        print(json_data)
-        with open("saved_report_history.json", "w") as json_file:
-            json.dump(json_data, json_file, indent=4)
+        # Remove report from the saved report history
+        self.client.report_index.remove_report(self.current_report["ID"])
         self.current_report = None
 
 
     async def notify_reported_user(self, user_id, message):
-        user = await self.client.fetch_user(user_id)
-        if user:
-            await user.send(message)
-        else:
-            print(f"Failed to find user with ID {user_id}")
+        await self.client.user_cache.send_dm(user_id, message)
 
 
     async def delete_message(self, channel_id, message_id):
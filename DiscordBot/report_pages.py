@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from metrics import metrics
+
+# Reports shown per page of a moderator queue
+PAGE_SIZE = 5
+NEXT_KEYWORD = "next"
+PREV_KEYWORD = "prev"
+# Most rendered report fragments kept
+FRAGMENT_CACHE_SIZE = 5000
+
+
+class ReportFragments:
+    '''
+    Cache of each open report's rendered listing entry, shared by every moderator flow. Entries are keyed on the
+    report's version in the report index, so a fragment is only re-rendered after that report changes.
+    '''
+
+    def __init__(self, report_index, max_size=FRAGMENT_CACHE_SIZE):
+        self.report_index = report_index
+        self.max_size = max_size
+        self.fragments = OrderedDict() # Map from (ID, version, field, label) to rendered text, least recently used first
+
+    def render(self, report, field, label):
+        '''Report entry titled with its ID and one field (shown as label), followed by its other fields.'''
+        key = (report["ID"], self.report_index.version(report["ID"]), field, label)
+        fragment = self.fragments.get(key)
+        if fragment is not None:
+            self.fragments.move_to_end(key)
+            metrics.incr("report_fragments.hits")
+            return fragment
+        metrics.incr("report_fragments.misses")
+        fragment = f"__**ID: {report['ID']} - {label}: {report[field]}**__\n" + \
+            "\n".join([f"{key}: {value}" for key, value in report.items() if key != 'ID' and key != field])
+        self.fragments[key] = fragment
+        if len(self.fragments) > self.max_size:
+            self.fragments.popitem(last=False)
+        return fragment
+
+
+class ReportPager:
+    '''
+    Pages through a moderator's queue of reports, PAGE_SIZE at a time. The queue is held as report IDs; only the
+    reports on the current page (or the one picked) are loaded, through load_report.
+    '''
+
+    def __init__(self, IDs, load_report, fragments, field, label, page_size=PAGE_SIZE):
+        self.IDs = IDs
+        self.id_set = {str(ID) for ID in IDs}
+        self.load_report = load_report
+        self.fragments = fragments
+        self.field = field # Field shown next to each report's ID, as label
+        self.label = label
+        self.page_size = page_size
+        self.page = 0
+
+    def num_pages(self):
+        return max(1, -(-len(self.IDs) // self.page_size))
+
+    def turn(self, keyword):
+        '''Move to the next or previous page if keyword asks to; return whether it did.'''
+        if keyword == NEXT_KEYWORD:
+            self.page = min(self.page + 1, self.num_pages() - 1)
+            return True
+        if keyword == PREV_KEYWORD:
+            self.page = max(self.page - 1, 0)
+            return True
+        return False
+
+    def get(self, ID):
+        ID = ID.strip()
+        if ID not in self.id_set:
+            return None
+        return self.load_report(ID)
+
+    def render(self):
+        start = self.page * self.page_size
+        # Reports closed since the queue was listed load as None and are left out
+        reports = [self.load_report(ID) for ID in self.IDs[start:start + self.page_size]]
+        entries = [self.fragments.render(report, self.field, self.label) for report in reports if report]
+        footer = f"Page {self.page + 1} of {self.num_pages()} ({len(self.IDs)} reports)."
+        if self.num_pages() > 1:
+            footer += f" Say `{PREV_KEYWORD}` or `{NEXT_KEYWORD}` to see other pages."
+        return "\n\n".join(entries) + "\n\n" + footer
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+from report_journal import replay, SNAPSHOT_PATH, JOURNAL_PATH
+
+SQLITE_PATH = "saved_report_history.db"
+# Which backend ModBot uses for saved reports. Only "sqlite" pages reports in per user and is safe to read while the
+# persistence worker writes; an existing JSON journal history is migrated into it on first run.
+REPORT_STORE_BACKEND = "sqlite"
+
+
+class ReportStore:
+    '''
+    Interface for the saved report history backends. Reports are dicts keyed by the same fields the report flows
+    produce ("ID", "Reported user", "Status", "Priority", ...).
+    '''
+
+    def load(self):
+        '''Open the store and return the current report counter.'''
+        raise NotImplementedError
+
+    def add_report(self, report_details, counter):
+        raise NotImplementedError
+
+    def set_report_val(self, ID, key, value):
+        raise NotImplementedError
+
+    def remove_report(self, ID):
+        raise NotImplementedError
+
+    def get_report(self, ID):
+        raise NotImplementedError
+
+    def get_user_reports(self, reported_user):
+        raise NotImplementedError
+
+    def get_report_keys(self):
+        '''(ID, Reported user, Status, Priority) for every report, without loading report bodies.'''
+        raise NotImplementedError
+
+    def get_all_reports(self):
+        '''
+        Return {"counter": int, "user_reports": {user: [report]}}, the saved_report_history.json format. Only open
+        reports are in the store, closed ones live in the report archive.
+        '''
+        raise NotImplementedError
+
+    def import_reports(self, json_data):
+        raise NotImplementedError
+
+    def commit(self):
+        '''Make preceding writes durable. Called once per batch by the persistence worker.'''
+        pass
+
+    def export_json(self, path=SNAPSHOT_PATH, archive=None):
+        '''Write the saved_report_history.json format, with the closed reports in archive (a ReportArchive) if given.'''
+        data = self.get_all_reports()
+        if archive:
+            for report in archive.iter_reports():
+                data["user_reports"].setdefault(report["Reported user"], []).append(report)
+            for reports in data["user_reports"].values():
+                reports.sort(key=lambda report: report["ID"])
+        with open(path, "w") as json_file:
+            json.dump(data, json_file, indent=4)
+
+    def import_json(self, path=SNAPSHOT_PATH):
+        with open(path, "r") as json_file:
+            self.import_reports(json.load(json_file))
+
+
+class SQLiteReportStore(ReportStore):
+    '''
+    Report store backed by SQLite. Each report is kept as its JSON document alongside indexed columns for the
+    fields the moderator flows look reports up by, so lookups never scan the whole history.
+
+    Writes go through one connection used by the persistence worker's thread; reads use a second connection so they
+    never share a transaction with an in-progress write.
+    '''
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.conn = None
+        self.read_conn = None
+
+    def load(self):
+        is_new = not os.path.isfile(self.path)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript('''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY,
+                reported_user TEXT,
+                status TEXT,
+                priority TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS reports_reported_user ON reports (reported_user);
+            CREATE INDEX IF NOT EXISTS reports_status_priority ON reports (status, priority);
+            CREATE INDEX IF NOT EXISTS reports_priority ON reports (priority);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+        ''')
+        self.conn.commit()
+        # Migrate an existing JSON history (snapshot plus journal tail) into a fresh database
+        if is_new and os.path.isfile(SNAPSHOT_PATH):
+            self.import_reports(replay(SNAPSHOT_PATH, [JOURNAL_PATH + ".compacting", JOURNAL_PATH]))
+        self.read_conn = sqlite3.connect(self.path, check_same_thread=False)
+        return self.get_counter()
+
+    def get_counter(self):
+        row = self.read_conn.execute("SELECT value FROM meta WHERE key = 'counter'").fetchone()
+        return row[0] if row else 0
+
+    def _insert(self, report):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reports (id, reported_user, status, priority, data) VALUES (?, ?, ?, ?, ?)",
+            (report["ID"], report.get("Reported user"), report.get("Status"), report.get("Priority"), json.dumps(report))
+        )
+
+    def _set_counter(self, counter):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('counter', ?) ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (counter,)
+        )
+
+    def add_report(self, report_details, counter):
+        self._insert(report_details)
+        self._set_counter(counter)
+
+    def set_report_val(self, ID, key, value):
+        row = self.conn.execute("SELECT data FROM reports WHERE id = ?", (int(ID),)).fetchone()
+        if not row:
+            return
+        report = json.loads(row[0])
+        report[key] = value
+        self._insert(report)
+
+    def remove_report(self, ID):
+        self.conn.execute("DELETE FROM reports WHERE id = ?", (int(ID),))
+
+    def commit(self):
+        self.conn.commit()
+
+    def get_report(self, ID):
+        row = self.read_conn.execute("SELECT data FROM reports WHERE id = ?", (int(ID),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_user_reports(self, reported_user):
+        rows = self.read_conn.execute("SELECT data FROM reports WHERE reported_user = ? ORDER BY id", (reported_user,))
+        return [json.loads(row[0]) for row in rows]
+
+    def get_report_keys(self):
+        return self.read_conn.execute("SELECT id, reported_user, status, priority FROM reports ORDER BY id").fetchall()
+
+    def get_all_reports(self):
+        user_reports = {}
+        for row in self.read_conn.execute("SELECT data FROM reports ORDER BY id"):
+            report = json.loads(row[0])
+            user_reports.setdefault(report["Reported user"], []).append(report)
+        return {"counter": self.get_counter(), "user_reports": user_reports}
+
+    def import_reports(self, json_data):
+        for reports in json_data["user_reports"].values():
+            for report in reports:
+                self._insert(report)
+        self._set_counter(json_data["counter"])
+        self.conn.commit()
+
+
+def make_report_store(backend=REPORT_STORE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteReportStore()
+    raise ValueError(f"Unknown report store backend: {backend}")
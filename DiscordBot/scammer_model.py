@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+import numpy as np
+from metadata_service import COLUMNS
+from metrics import metrics
+
+# Model exported by the "Model Export" cell of Proxy+Synthetic_Data.ipynb (run from the repository root): {"model": ..., "features": [...]}
+SCAMMER_MODEL_PATH = "datasets/scammer_model.joblib"
+# Most per-user scores kept
+SCORE_CACHE_SIZE = 100000
+
+
+class ScammerScorer:
+    '''
+    Scores how likely a user is to be a scammer with the profile model from Proxy+Synthetic_Data.ipynb, in-process.
+    Users in metadata.csv are scored from their recorded profile features. Anyone else gets no score: Discord doesn't
+    expose their bio, links or post count, the model's strongest signals, and filling those in with 0 reads as a fake
+    account. Scores are computed in vectorized batches and cached per user. Without an exported model, the
+    precomputed probability_scammer in metadata.csv is used instead.
+    '''
+
+    def __init__(self, user_metadata, model_path=SCAMMER_MODEL_PATH, cache_size=SCORE_CACHE_SIZE):
+        self.user_metadata = user_metadata
+        self.model_path = model_path
+        self.cache_size = cache_size
+        self.model = None
+        self.features = []
+        self.cache = OrderedDict() # Map from username to score, least recently used first
+
+    def load(self):
+        if not os.path.isfile(self.model_path):
+            print(f"No scammer model at {self.model_path}, using the precomputed scores in metadata.csv")
+            return self
+        import joblib
+        bundle = joblib.load(self.model_path)
+        self.model = bundle["model"]
+        self.features = bundle["features"]
+        self.score_metadata()
+        return self
+
+    def score_metadata(self):
+        '''Score everyone in metadata.csv in one vectorized call, straight from its column arrays.'''
+        if not len(self.user_metadata):
+            return
+        fields = {column: field for column, (field, _) in COLUMNS.items()}
+        matrix = np.column_stack([self.user_metadata.columns[fields[feature]] for feature in self.features]).astype(np.float64)
+        if hasattr(self.model, "feature_names_in_"):
+            import pandas as pd
+            matrix = pd.DataFrame(matrix, columns=self.features)
+        probabilities = self.model.predict_proba(matrix)[:, 1]
+        self.cache.clear()
+        for name, probability in zip(self.user_metadata.names[:self.cache_size], probabilities):
+            self.cache[name] = round(float(probability), 2)
+
+    def feature_row(self, record):
+        features = {column: getattr(record, field) for column, (field, _) in COLUMNS.items()}
+        return [features[feature] for feature in self.features]
+
+    def score_users(self, users):
+        '''Scammer probabilities for several Discord users at once, None where there's nothing to score from.'''
+        scores = [self.cache.get(user.name) for user in users]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        for user, score in zip(users, scores):
+            if score is not None:
+                self.cache.move_to_end(user.name)
+        if not missing:
+            metrics.incr("scammer_model.cache_hits", len(users))
+            return scores
+        metrics.incr("scammer_model.cache_hits", len(users) - len(missing))
+        records = {i: self.user_metadata.get(users[i].name, users[i].id) for i in missing}
+        # Users without metadata stay unscored
+        known = [i for i in missing if records[i] is not None]
+        if self.model is None:
+            for i in known:
+                scores[i] = records[i].probability_scammer
+        elif known:
+            matrix = np.array([self.feature_row(records[i]) for i in known], dtype=np.float64)
+            if hasattr(self.model, "feature_names_in_"):
+                import pandas as pd
+                # Fitted on a DataFrame, so pass one to keep sklearn from warning about missing column names
+                matrix = pd.DataFrame(matrix, columns=self.features)
+            for i, probability in zip(known, self.model.predict_proba(matrix)[:, 1]):
+                scores[i] = round(float(probability), 2)
+            metrics.incr("scammer_model.scored", len(known))
+        for i in missing:
+            if scores[i] is not None:
+                self.cache[users[i].name] = scores[i]
+                self.cache.move_to_end(users[i].name)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return scores
+
+    def score(self, user):
+        return self.score_users([user])[0]
@@ -0,0 +1,38 @@
+import asyncio
+import time
+from metrics import metrics
+
+
+class StartupTimer:
+    '''
+    Times the bot's startup. The main path is split into consecutive phases with mark(); slow setup that doesn't
+    need to block the gateway connection runs on a thread with run_in_background() and is timed separately. Every
+    phase is printed and recorded as a startup.<name> gauge in the metrics.
+    '''
+
+    def __init__(self):
+        self.start = self.last = time.monotonic()
+        self.reported = False
+
+    def record(self, name, seconds):
+        metrics.set(f"startup.{name}", seconds)
+        print(f"Startup: {name} took {seconds:.2f}s")
+
+    def mark(self, name):
+        '''End the current phase of the main startup path.'''
+        now = time.monotonic()
+        self.record(name, now - self.last)
+        self.last = now
+
+    def ready(self):
+        '''Record the total time to ready, once (on_ready also fires on reconnects).'''
+        if not self.reported:
+            self.reported = True
+            self.record("total", time.monotonic() - self.start)
+
+    async def run_in_background(self, name, fn):
+        '''Run fn on a worker thread, concurrently with the rest of startup, and return its result.'''
+        start = time.monotonic()
+        result = await asyncio.get_running_loop().run_in_executor(None, fn)
+        self.record(name, time.monotonic() - start)
+        return result
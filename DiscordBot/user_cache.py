@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+import discord
+from metrics import metrics
+
+# Most users and DM channels kept
+USER_CACHE_SIZE = 10000
+# How long a cached user or DM channel is reused before it is looked up again (seconds)
+USER_CACHE_TTL = 60 * 60
+
+
+class UserCache:
+    '''
+    Users and opened DM channels for the notification paths, so notifying the same user again doesn't cost a REST
+    round trip. A user is looked for here first, then in the gateway's own cache, and only then fetched over REST.
+    Entries expire after ttl seconds and the least recently used are evicted past max_size.
+    '''
+
+    def __init__(self, client, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.users = OrderedDict() # Map from user ID to [user, time cached], least recently used first
+        self.dm_channels = OrderedDict() # Map from user ID to [DM channel, time cached], least recently used first
+
+    def _get(self, entries, user_id):
+        entry = entries.get(user_id)
+        if entry and time.time() - entry[1] > self.ttl:
+            del entries[user_id]
+            entry = None
+        if entry:
+            entries.move_to_end(user_id)
+        return entry[0] if entry else None
+
+    def _put(self, entries, user_id, value):
+        entries[user_id] = [value, time.time()]
+        entries.move_to_end(user_id)
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    async def get_user(self, user_id):
+        user_id = int(user_id)
+        user = self._get(self.users, user_id)
+        if user:
+            metrics.incr("user_cache.hits")
+            return user
+        user = self.client.get_user(user_id)
+        if user:
+            metrics.incr("user_cache.gateway_hits")
+        else:
+            metrics.incr("user_cache.misses")
+            try:
+                user = await self.client.fetch_user(user_id)
+            except discord.NotFound:
+                return None
+        self._put(self.users, user_id, user)
+        return user
+
+    async def get_dm_channel(self, user_id):
+        user_id = int(user_id)
+        channel = self._get(self.dm_channels, user_id)
+        if channel:
+            metrics.incr("user_cache.dm_channel_hits")
+            return channel
+        metrics.incr("user_cache.dm_channel_misses")
+        user = await self.get_user(user_id)
+        if not user:
+            return None
+        channel = user.dm_channel or await user.create_dm()
+        self._put(self.dm_channels, user_id, channel)
+        return channel
+
+    async def send_dm(self, user_id, content):
+        '''DM a user, returning whether they could be found.'''
+        channel = await self.get_dm_channel(user_id)
+        if not channel:
+            print(f"Failed to find user with ID {user_id}")
+            return False
+        await channel.send(content)
+        return True